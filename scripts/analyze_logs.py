@@ -4,88 +4,1297 @@ Smart Log Analyzer & Clusterer
 Groups similar log lines to reduce token usage for LLMs.
 """
 
+import io
+import os
 import sys
 import re
+import glob
+import json
+import hashlib
+import bz2
+import gzip
+import lzma
+import mmap
+import zlib
+import time
+import queue
 import argparse
+import threading
 from collections import defaultdict
-from typing import Dict, List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+# Optional import for zstd-compressed logs
+ZSTD_AVAILABLE = False
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    pass
+
+# What reading a missing, unreadable, truncated or corrupt (compressed) log can raise
+READ_ERRORS: Tuple[type, ...] = (RuntimeError, OSError, EOFError, lzma.LZMAError, zlib.error)
+if ZSTD_AVAILABLE:
+    READ_ERRORS += (zstandard.ZstdError,)
+
+# Variable-part patterns, in the order they used to be applied one `re.sub` at a
+# time. They are combined into a single alternation compiled once at import so
+# each line is scanned in one pass.
+TOKEN_PATTERNS: List[Tuple[str, str]] = [
+    # Timestamp (ISO8601, standard formats)
+    ('TIMESTAMP', r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?'),
+    # UUIDs
+    ('UUID', r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}'),
+    # IP addresses
+    ('IP', r'\b(?:\d{1,3}\.){3}\d{1,3}\b'),
+    # Hex numbers (common in memory addresses)
+    ('HEX', r'0x[0-9a-fA-F]+'),
+    # Generic numbers (careful not to kill error codes)
+    # We keep numbers if they are short, but replacing long sequences
+    ('NUM', r'\b\d{5,}\b'),
+]
+
+# Every pattern starts with a digit (`\d`, so Unicode digits too) or lowercase hex letter;
+# the leading lookahead lets the regex engine skip straight to candidate positions.
+TOKEN_RE = re.compile(r'(?=[\da-f])(?:' + '|'.join(f'(?P<{name}>{regex})' for name, regex in TOKEN_PATTERNS) + ')')
+SEQUENTIAL_RES = [(re.compile(regex), f'<{name}>') for name, regex in TOKEN_PATTERNS]
+
+# Characters that may join a match to a higher-priority pattern starting inside it
+# (e.g. `123452024-01-01 ...`), on top of word characters which shift `\b`.
+GLUE_AFTER = {
+    'TIMESTAMP': frozenset(),
+    'UUID': frozenset('-'),
+    'IP': frozenset(),
+    'HEX': frozenset('-.'),
+    'NUM': frozenset('-.'),
+}
+
+# Indexed by `match.lastindex` (the named groups are the only capturing groups).
+_GROUPS = [None] + [(f'<{name}>', GLUE_AFTER[name]) for name, _ in TOKEN_PATTERNS]
+
+class _GluedTokens(Exception):
+    """A match touches another token; the single pass may disagree with pattern priority."""
+
+def _placeholder(match: 're.Match[str]') -> str:
+    placeholder, glue_after = _GROUPS[match.lastindex]
+    start, end = match.span()
+    text = match.string
+    if start:
+        before = text[start - 1]
+        if before.isalnum() or before == '_':
+            raise _GluedTokens
+    if end < len(text):
+        after = text[end]
+        if after.isalnum() or after == '_' or after in glue_after:
+            raise _GluedTokens
+    return placeholder
+
+def _tokenize_sequential(line: str) -> str:
+    """Apply the patterns one at a time, in priority order."""
+    for regex, placeholder in SEQUENTIAL_RES:
+        line = regex.sub(placeholder, line)
+    return line.strip()
 
 def tokenize_line(line: str) -> str:
     """
     Replace variable parts of a log line (timestamps, IPs, numbers) with placeholders
     to identify the underlying pattern.
     """
-    # Remove Timestamp (ISO8601, standard formats)
-    line = re.sub(r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?', '<TIMESTAMP>', line)
-    
-    # Remove UUIDs
-    line = re.sub(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}', '<UUID>', line)
-    
-    # Remove IP addresses
-    line = re.sub(r'\b(?:\d{1,3}\.){3}\d{1,3}\b', '<IP>', line)
-    
-    # Remove Hex numbers (common in memory addresses)
-    line = re.sub(r'0x[0-9a-fA-F]+', '<HEX>', line)
-    
-    # Remove generic numbers (careful not to kill error codes)
-    # We keep numbers if they are short, but replacing long sequences
-    line = re.sub(r'\b\d{5,}\b', '<NUM>', line)
+    try:
+        return TOKEN_RE.sub(_placeholder, line).strip()
+    except _GluedTokens:
+        # Tokens written back to back (no separator) fall back to the ordered passes
+        # so the output stays identical to applying each pattern in turn.
+        return _tokenize_sequential(line)
 
-    return line.strip()
+# Bytes twins of the patterns above, used by the mmap reader. Regex classes such as
+# `\d`, `\b` and `strip()` only agree between str and bytes on ASCII, so the bytes
+# path is limited to ASCII lines (see `cluster_file`).
+TOKEN_RE_BYTES = re.compile(TOKEN_RE.pattern.encode())
+SEQUENTIAL_RES_BYTES = [(re.compile(regex.pattern.encode()), placeholder.encode())
+                        for regex, placeholder in SEQUENTIAL_RES]
+_WORD_BYTES = frozenset(b'0123456789_abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ')
+_GROUPS_BYTES = [None] + [(placeholder.encode(), frozenset(''.join(glue_after).encode()))
+                          for placeholder, glue_after in _GROUPS[1:]]
+# ASCII characters `str.strip()` removes but `bytes.strip()` keeps
+_STR_ONLY_WHITESPACE = frozenset(b'\x1c\x1d\x1e\x1f')
 
-def analyze_logs(file_path: str, show_info: bool = False) -> None:
+def _placeholder_bytes(match: 're.Match[bytes]') -> bytes:
+    placeholder, glue_after = _GROUPS_BYTES[match.lastindex]
+    start, end = match.span()
+    text = match.string
+    if start and text[start - 1] in _WORD_BYTES:
+        raise _GluedTokens
+    if end < len(text):
+        after = text[end]
+        if after in _WORD_BYTES or after in glue_after:
+            raise _GluedTokens
+    return placeholder
+
+def tokenize_bytes(line: bytes) -> bytes:
     """
-    Read log file, cluster lines, and print summary.
+    `tokenize_line` for ASCII bytes, without decoding.
     """
-    clusters: Dict[str, Dict] = defaultdict(lambda: {'count': 0, 'sample': ''})
-    
     try:
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            for line in f:
-                line = line.strip()
+        return TOKEN_RE_BYTES.sub(_placeholder_bytes, line).strip()
+    except _GluedTokens:
+        for regex, placeholder in SEQUENTIAL_RES_BYTES:
+            line = regex.sub(placeholder, line)
+        return line.strip()
+
+TIMESTAMP_RE = re.compile(TOKEN_PATTERNS[0][1])
+TIMESTAMP_RE_BYTES = re.compile(TOKEN_PATTERNS[0][1].encode())
+TIMELINES = ('range', 'minute')  # first/last timestamps; also a per-minute histogram
+
+def line_timestamp(pattern, line) -> Optional[str]:
+    """
+    The first timestamp of a (str or bytes) line whose pattern has a `<TIMESTAMP>`,
+    in `YYYY-MM-DDTHH:MM:SS` form. Offsets are kept as written, not normalized.
+    """
+    if isinstance(line, bytes):
+        if b'<TIMESTAMP>' not in pattern:
+            return None
+        match = TIMESTAMP_RE_BYTES.search(line)
+        return match.group().decode('ascii').replace(' ', 'T') if match else None
+    if '<TIMESTAMP>' not in pattern:
+        return None
+    match = TIMESTAMP_RE.search(line)
+    return match.group().replace(' ', 'T') if match else None
+
+def stamp(entry: Dict, timestamp: str, timeline: str, count: int = 1) -> None:
+    """Widen an entry's first/last seen range (and per-minute counts) by one timestamp."""
+    if timestamp < entry.get('first', '\uffff'):
+        entry['first'] = timestamp
+    if timestamp > entry.get('last', ''):
+        entry['last'] = timestamp
+    if timeline == 'minute':
+        minutes = entry.setdefault('minutes', {})
+        minute = timestamp[:16]
+        minutes[minute] = minutes.get(minute, 0) + count
+
+def merge_timeline(entry: Dict, other: Dict) -> None:
+    """Fold another entry's first/last range and per-minute counts into `entry`."""
+    if 'first' in other:
+        if other['first'] < entry.get('first', '\uffff'):
+            entry['first'] = other['first']
+        if other['last'] > entry.get('last', ''):
+            entry['last'] = other['last']
+    if 'minutes' in other:
+        minutes = entry.setdefault('minutes', {})
+        for minute, count in other['minutes'].items():
+            minutes[minute] = minutes.get(minute, 0) + count
+
+class SpaceSaving:
+    """
+    Space-Saving heavy-hitters sketch (Metwally et al.) holding at most `capacity`
+    clusters. A tracked count over-estimates the true count by at most its `error`,
+    and any pattern seen more than `total / capacity` times is guaranteed to be tracked.
+    """
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.total = 0
+        self.clusters: Dict = {}  # pattern -> {'count', 'sample', 'error'}
+        self._buckets: Dict[int, Dict] = {}  # count -> patterns with that count, oldest first
+        self._min = 0
+        self._untracked = 0  # Bound carried over from merges
+
+    def __len__(self) -> int:
+        return len(self.clusters)
+
+    def _move(self, pattern, old: int, new: int) -> None:
+        """Move `pattern` from the `old` count bucket (0: none) to the `new` one."""
+        self._buckets.setdefault(new, {})[pattern] = None
+        if old:
+            bucket = self._buckets[old]
+            del bucket[pattern]
+            if not bucket:
+                del self._buckets[old]
+                if old == self._min:
+                    self._min = new if new == old + 1 else min(self._buckets)
+        if not self._min or new < self._min:
+            self._min = new
+
+    def add(self, pattern, sample, count: int = 1, error: int = 0) -> Dict:
+        """
+        Count `pattern` `count` times (with `error` when folding in another sketch) and
+        return its entry.
+        """
+        self.total += count
+        entry = self.clusters.get(pattern)
+        if entry is not None:
+            old = entry['count']
+            entry['count'] = old + count
+            entry['error'] += error
+            self._move(pattern, old, old + count)
+            return entry
+
+        if len(self.clusters) < self.capacity:
+            entry = self.clusters[pattern] = {'count': count, 'sample': sample, 'error': error}
+            self._move(pattern, 0, count)
+            return entry
+
+        # Full: the newcomer replaces a minimum-count pattern and inherits its count as error
+        floor = self._min
+        bucket = self._buckets[floor]
+        victim = next(iter(bucket))
+        del bucket[victim]
+        del self.clusters[victim]
+        if not bucket:
+            del self._buckets[floor]
+            self._min = min(self._buckets) if self._buckets else 0
+        entry = self.clusters[pattern] = {'count': floor + count, 'sample': sample, 'error': floor + error}
+        self._move(pattern, 0, floor + count)
+        return entry
+
+    def merge(self, other: 'SpaceSaving') -> 'SpaceSaving':
+        """
+        Fold another sketch in (mergeable summaries): a pattern one side does not track
+        may still have been seen up to that side's floor, so the floor is added to both
+        its count and error before pruning back to `capacity`.
+        """
+        self_floor, other_floor = self._floor(), other._floor()
+        merged: Dict = {}
+        for pattern, data in self.clusters.items():
+            theirs = other.clusters.get(pattern)
+            merged[pattern] = dict(
+                data,  # Keeps extra keys such as per-source counts
+                count=data['count'] + (theirs['count'] if theirs else other_floor),
+                error=data['error'] + (theirs['error'] if theirs else other_floor),
+            )
+            if theirs:
+                merge_timeline(merged[pattern], theirs)
+        for pattern, data in other.clusters.items():
+            if pattern not in merged:
+                merged[pattern] = dict(data, count=data['count'] + self_floor,
+                                       error=data['error'] + self_floor)
+
+        ranked = sorted(merged, key=lambda p: merged[p]['count'], reverse=True)
+        kept = set(ranked[:self.capacity])
+        pruned = [merged[p]['count'] for p in ranked[self.capacity:]]
+        self._untracked = max([self._untracked, other._untracked, self_floor + other_floor] + pruned)
+
+        self.total += other.total
+        self.clusters = {p: data for p, data in merged.items() if p in kept}
+        self._buckets = {}
+        self._min = 0
+        for pattern, data in self.clusters.items():
+            self._move(pattern, 0, data['count'])
+        return self
+
+    def _floor(self) -> int:
+        """Highest count an untracked pattern can have been evicted with."""
+        return self._min if len(self.clusters) >= self.capacity else 0
+
+    @property
+    def untracked_bound(self) -> int:
+        """Any pattern seen more often than this is tracked."""
+        return max(self._floor(), self._untracked)
+
+    def to_state(self) -> Dict:
+        return {'kind': 'space_saving', 'capacity': self.capacity, 'total': self.total,
+                'untracked': self._untracked, 'clusters': self.clusters}
+
+    @classmethod
+    def from_state(cls, state: Dict) -> 'SpaceSaving':
+        sketch = cls(state['capacity'])
+        for pattern, data in state['clusters'].items():
+            sketch.add(pattern, data['sample'], data['count'], data['error']).update(data)
+        sketch.total = state['total']
+        sketch._untracked = state['untracked']
+        return sketch
+
+WILDCARD = '<*>'
+
+class DrainMiner:
+    """
+    Drain-style online template miner (He et al., 2017). A line's masked tokens are
+    routed through a fixed-depth prefix tree (token count, then the leading tokens)
+    to a small leaf of groups and merged into the most similar one, whose template
+    keeps equal tokens and turns differing positions into `<*>`.
+    """
+
+    def __init__(self, depth: int = 4, similarity: float = 0.4, max_children: int = 100):
+        self.depth = depth
+        self.similarity = similarity
+        self.max_children = max_children
+        self.total = 0
+        self.groups: List[Dict] = []  # {'tokens', 'count', 'sample'} in first-seen order
+        self._root: Dict = {}
+
+    def __len__(self) -> int:
+        return len(self.groups)
+
+    def _leaf(self, tokens: List[str]) -> List[Dict]:
+        node = self._root.setdefault(len(tokens), {})
+        for token in tokens[:max(self.depth - 2, 1)]:
+            if token not in node:
+                # Tokens with digits are likely variables; a full node also routes to `<*>`
+                if any(c.isdigit() for c in token) or len(node) >= self.max_children:
+                    token = WILDCARD
+            node = node.setdefault(token, {})
+        return node.setdefault(None, [])
+
+    def _best_group(self, leaf: List[Dict], tokens: List[str]) -> Optional[Dict]:
+        best, best_sim, best_wildcards = None, -1.0, -1
+        for group in leaf:
+            same = wildcards = 0
+            for known, token in zip(group['tokens'], tokens):
+                if known == WILDCARD:
+                    wildcards += 1
+                elif known == token:
+                    same += 1
+            sim = same / len(tokens)
+            if sim > best_sim or (sim == best_sim and wildcards > best_wildcards):
+                best, best_sim, best_wildcards = group, sim, wildcards
+        return best if best_sim >= self.similarity else None
+
+    def add(self, pattern: str, sample: str, count: int = 1) -> Optional[Dict]:
+        """Merge a masked line (or another miner's template) into the tree; returns its group."""
+        tokens = pattern.split()
+        if not tokens:
+            return None
+        self.total += count
+        leaf = self._leaf(tokens)
+        group = self._best_group(leaf, tokens)
+        if group is None:
+            group = {'tokens': tokens, 'count': 0, 'sample': sample}
+            leaf.append(group)
+            self.groups.append(group)
+        else:
+            group['tokens'] = [known if known == token else WILDCARD
+                               for known, token in zip(group['tokens'], tokens)]
+        group['count'] += count
+        return group
+
+    def merge(self, other: 'DrainMiner') -> 'DrainMiner':
+        """Fold another miner in by replaying its templates, weighted by count."""
+        for group in other.groups:
+            target = self.add(' '.join(group['tokens']), group['sample'], group['count'])
+            merge_timeline(target, group)
+        return self
+
+    def to_state(self) -> Dict:
+        # Groups stay in the leaf of the line that created them, which the template alone
+        # no longer identifies, so the tree paths are saved alongside the groups.
+        index = {id(group): i for i, group in enumerate(self.groups)}
+        leaves = []
+        stack = [((length,), node) for length, node in self._root.items()]
+        while stack:
+            path, node = stack.pop()
+            for key, child in node.items():
+                if key is None:
+                    leaves.append([list(path), [index[id(group)] for group in child]])
+                else:
+                    stack.append((path + (key,), child))
+        return {'kind': 'drain', 'depth': self.depth, 'similarity': self.similarity,
+                'max_children': self.max_children, 'total': self.total,
+                'groups': self.groups, 'leaves': leaves}
+
+    @classmethod
+    def from_state(cls, state: Dict) -> 'DrainMiner':
+        miner = cls(state['depth'], state['similarity'], state['max_children'])
+        miner.total = state['total']
+        miner.groups = state['groups']
+        for path, members in state['leaves']:
+            node = miner._root
+            for key in path:
+                node = node.setdefault(key, {})
+            node.setdefault(None, []).extend(miner.groups[i] for i in members)
+        return miner
+
+    @property
+    def clusters(self) -> Dict[str, Dict]:
+        """Template -> count/sample, joining groups that generalized to the same template."""
+        table: Dict[str, Dict] = {}
+        for group in self.groups:
+            template = ' '.join(group['tokens'])
+            if template in table:
+                entry = table[template]
+                entry['count'] += group['count']
+                for source, count in group.get('sources', {}).items():
+                    entry['sources'][source] = entry['sources'].get(source, 0) + count
+            else:
+                entry = table[template] = {'count': group['count'], 'sample': group['sample'],
+                                           'template': template}
+                if 'sources' in group:
+                    entry['sources'] = dict(group['sources'])
+            merge_timeline(entry, group)
+        return table
+
+ENGINES = ('exact', 'drain')
+
+def new_clusters(max_clusters: Optional[int] = None, engine: str = 'exact'):
+    """
+    An exact cluster table, a Space-Saving sketch when `max_clusters` is set, or a
+    Drain template miner for `engine='drain'`.
+    """
+    if engine == 'drain':
+        return DrainMiner()
+    if max_clusters:
+        return SpaceSaving(max_clusters)
+    return defaultdict(lambda: {'count': 0, 'sample': ''})
+
+def tally(pairs: Iterable[Tuple], clusters, timeline: Optional[str] = None):
+    """
+    Count (pattern, sample) pairs into an exact table, or any table object with an
+    `add(pattern, sample)` method (`SpaceSaving`, `DrainMiner`).
+    The sample of a pattern is the first line seen for it. With a `timeline`, each
+    entry also records the first/last timestamp seen (and per-minute counts).
+    """
+    if timeline:
+        return _tally_timeline(pairs, clusters, timeline)
+    if not isinstance(clusters, dict):
+        add = clusters.add
+        for pattern, sample in pairs:
+            add(pattern, sample)
+        return clusters
+
+    get = clusters.get
+    for pattern, sample in pairs:
+        entry = get(pattern)
+        if entry is None:
+            clusters[pattern] = {'count': 1, 'sample': sample}
+        else:
+            entry['count'] += 1
+    return clusters
+
+def _tally_timeline(pairs: Iterable[Tuple], clusters, timeline: str):
+    exact = isinstance(clusters, dict)
+    for pattern, sample in pairs:
+        if exact:
+            entry = clusters.get(pattern)
+            if entry is None:
+                entry = clusters[pattern] = {'count': 1, 'sample': sample}
+            else:
+                entry['count'] += 1
+        else:
+            entry = clusters.add(pattern, sample)
+            if entry is None:
+                continue
+        timestamp = line_timestamp(pattern, sample)
+        if timestamp is not None:
+            stamp(entry, timestamp, timeline)
+    return clusters
+
+def iter_patterns(lines: Iterable[str], show_info: bool = False) -> Iterator[Tuple[str, str]]:
+    """
+    Yield (pattern, line) for each non-blank line that passes the noise filter.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        # Filter Noise if not requested
+        if not show_info and ('INFO' in line or 'DEBUG' in line):
+            continue
+
+        yield tokenize_line(line), line
+
+def cluster_lines(lines: Iterable[str], show_info: bool = False, clusters=None,
+                  timeline: Optional[str] = None):
+    """
+    Tokenize and group raw log lines into `clusters` (pattern -> count/sample).
+    """
+    if clusters is None:
+        clusters = new_clusters()
+    return tally(iter_patterns(lines, show_info), clusters, timeline)
+
+def merge_clusters(clusters, partial):
+    """
+    Fold `partial` into `clusters`: counts are summed and the first-seen sample is kept,
+    so partials must be merged in input order.
+    """
+    if not isinstance(clusters, dict):
+        return clusters.merge(partial)
+    for pattern, data in partial.items():
+        if pattern in clusters:
+            clusters[pattern]['count'] += data['count']
+            merge_timeline(clusters[pattern], data)
+        else:
+            clusters[pattern] = dict(data)
+    return clusters
+
+def chunk_offsets(file_path: str, workers: int, start: int = 0,
+                  end: Optional[int] = None) -> List[Tuple[int, int]]:
+    """
+    Split the byte range [start, end) of a file (whole file by default) into up to
+    `workers` ranges, each ending just after a newline.
+    """
+    if end is None:
+        end = os.path.getsize(file_path)
+    bounds = [start]
+    with open(file_path, 'rb') as f:
+        for i in range(1, workers):
+            target = max(start + (end - start) * i // workers, bounds[-1])
+            if target >= end:
+                break
+            f.seek(target)
+            f.readline()  # Move to the start of the next full line
+            bounds.append(min(f.tell(), end))
+    bounds.append(end)
+    return [(lo, hi) for lo, hi in zip(bounds, bounds[1:]) if hi > lo]
+
+# The mmap reader drops pages it has already scanned in windows of this size, so
+# peak RSS stays flat instead of growing with the mapped file.
+MMAP_RELEASE_BYTES = 4 * 1024 * 1024
+
+def iter_file_patterns(file_path: str, show_info: bool = False,
+                       start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[bytes, bytes]]:
+    """
+    Yield UTF-8 (pattern, sample) pairs for the byte range [start, end) of a file
+    (whole file by default), read through mmap. Noise filtering and tokenization run
+    on bytes, so nothing is decoded on the common path. Results match text mode.
+    """
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        end = size if end is None else min(end, size)
+        if end <= start:
+            return
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            can_release = hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_DONTNEED')
+            if hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            released = start - start % mmap.PAGESIZE
+            mm.seek(start)
+            readline = mm.readline
+            pos = start
+            while pos < end:
+                raw = readline()
+                if not raw:
+                    break
+                pos += len(raw)
+
+                if can_release and pos - released >= MMAP_RELEASE_BYTES:
+                    window = (pos - released) // mmap.PAGESIZE * mmap.PAGESIZE
+                    mm.madvise(mmap.MADV_DONTNEED, released, window)
+                    released += window
+
+                line = raw.strip()
                 if not line:
                     continue
-                
-                # Filter Noise if not requested
-                if not show_info and ('INFO' in line or 'DEBUG' in line):
-                    continue
 
-                pattern = tokenize_line(line)
-                
-                if clusters[pattern]['count'] == 0:
-                    clusters[pattern]['sample'] = line
-                
-                clusters[pattern]['count'] += 1
-                
-    except FileNotFoundError:
-        print(f"Error: File '{file_path}' not found.")
-        sys.exit(1)
+                if line.find(b'\r') < 0:
+                    # Filter Noise if not requested (ASCII markers survive decoding intact)
+                    if not show_info and (line.find(b'INFO') >= 0 or line.find(b'DEBUG') >= 0):
+                        continue
+                    if (line.isascii() and line[0] not in _STR_ONLY_WHITESPACE
+                            and line[-1] not in _STR_ONLY_WHITESPACE):
+                        yield tokenize_bytes(line), line
+                        continue
+
+                # Non-ASCII or embedded CR: decode this line and take the text path
+                for pattern, part in iter_patterns(raw.decode('utf-8', errors='ignore').split('\r'), show_info):
+                    yield pattern.encode('utf-8'), part.encode('utf-8')
+
+def cluster_file(file_path: str, show_info: bool = False, start: int = 0,
+                 end: Optional[int] = None, max_clusters: Optional[int] = None,
+                 engine: str = 'exact', timeline: Optional[str] = None):
+    """
+    Cluster a file (or a byte range of it) through the mmap reader. Only the patterns
+    and samples that end up in the table are decoded.
+    """
+    pairs = iter_file_patterns(file_path, show_info, start, end)
+    if engine == 'drain':
+        # Templates are built from str tokens, so surviving lines are decoded up front
+        return tally(((p.decode('utf-8'), s.decode('utf-8')) for p, s in pairs), new_clusters(engine=engine),
+                     timeline)
+
+    table = tally(pairs, SpaceSaving(max_clusters) if max_clusters else {}, timeline)
+
+    if isinstance(table, SpaceSaving):
+        decoded = SpaceSaving(table.capacity)
+        for pattern, data in table.clusters.items():
+            entry = decoded.add(pattern.decode('utf-8'), data['sample'].decode('utf-8'),
+                                data['count'], data['error'])
+            merge_timeline(entry, data)
+        return decoded
+    return {pattern.decode('utf-8'): dict(data, sample=data['sample'].decode('utf-8'))
+            for pattern, data in table.items()}
+
+def _cluster_chunk(job: Tuple[str, int, int, bool, Optional[int], str, Optional[str]]):
+    """Worker entry point: cluster one byte range of a file."""
+    file_path, start, end, show_info, max_clusters, engine, timeline = job
+    return cluster_file(file_path, show_info, start, end, max_clusters, engine, timeline)
+
+def cluster_file_parallel(file_path: str, show_info: bool, workers: int,
+                          max_clusters: Optional[int] = None, engine: str = 'exact',
+                          start: int = 0, end: Optional[int] = None,
+                          timeline: Optional[str] = None):
+    """
+    Cluster a file (or a byte range of it) with one process per newline-aligned chunk
+    and merge the partials.
+    """
+    jobs = [(file_path, lo, hi, show_info, max_clusters, engine, timeline)
+            for lo, hi in chunk_offsets(file_path, workers, start, end)]
+    clusters = new_clusters(max_clusters, engine)
+    if isinstance(clusters, dict):
+        clusters = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # map() yields in submission order, which keeps the first-seen samples
+        for partial in pool.map(_cluster_chunk, jobs):
+            merge_clusters(clusters, partial)
+    return clusters
+
+SOURCES_SHOWN = 5  # Per-source counts listed under each pattern
+
+def print_summary(clusters, file_path: str, show_info: bool = False,
+                  top: Optional[int] = None) -> None:
+    """
+    Print clusters sorted by frequency, optionally only the `top` most frequent.
+    Sketch counts are shown as `[low-high x]` when they may be over-estimated, and
+    Drain clusters show their `<*>` template instead of a sample line, and clusters
+    merged from several files list their busiest sources.
+    """
+    sketch = clusters if isinstance(clusters, SpaceSaving) else None
+    miner = clusters if isinstance(clusters, DrainMiner) else None
+    if sketch is not None or miner is not None:
+        clusters = clusters.clusters
 
     # Sort by frequency (descending)
     sorted_clusters = sorted(clusters.items(), key=lambda x: x[1]['count'], reverse=True)
 
     print(f"=== Log Analysis Summary: {file_path} ===\n")
-    print(f"Total Unique Patterns: {len(sorted_clusters)}")
+    if miner is not None:
+        print(f"Total Templates: {len(sorted_clusters)} (Drain, similarity {miner.similarity})")
+    elif sketch is None:
+        print(f"Total Unique Patterns: {len(sorted_clusters)}")
+    else:
+        print(f"Tracked Patterns: {len(sorted_clusters)} (approximate, max {sketch.capacity})")
+        print(f"Patterns seen more than {sketch.untracked_bound}x are guaranteed to be listed")
+    if top is not None and len(sorted_clusters) > top:
+        print(f"Showing top {top}")
+        sorted_clusters = sorted_clusters[:top]
     print("-" * 60)
     
     for pattern, data in sorted_clusters:
         count = data['count']
-        sample = data['sample']
+        sample = data.get('template', data['sample'])
+        error = data.get('error', 0)
         
         # Truncate very long lines
         if len(sample) > 200:
             sample = sample[:197] + "..."
             
-        print(f"[{count}x] {sample}")
+        if error:
+            print(f"[{count - error}-{count}x] {sample}")
+        else:
+            print(f"[{count}x] {sample}")
+
+        sources = data.get('sources')
+        if sources:
+            ranked = sorted(sources.items(), key=lambda x: x[1], reverse=True)
+            listed = ", ".join(f"{source} ({n})" for source, n in ranked[:SOURCES_SHOWN])
+            more = f", +{len(ranked) - SOURCES_SHOWN} more" if len(ranked) > SOURCES_SHOWN else ""
+            print(f"    from {len(ranked)} source(s): {listed}{more}")
 
     print("-" * 60)
     if not show_info:
         print("(Note: INFO and DEBUG logs were hidden. Use --all to see them.)")
 
+FORMATS = ('text', 'json', 'ndjson')
+
+def cluster_records(clusters, top: Optional[int] = None) -> List[Dict]:
+    """
+    Clusters as plain dicts sorted by frequency: pattern (or Drain template), count,
+    sample, and whichever of error, first/last timestamp, per-minute counts and
+    per-source counts the table recorded.
+    """
+    if isinstance(clusters, (SpaceSaving, DrainMiner)):
+        clusters = clusters.clusters
+    ranked = sorted(clusters.items(), key=lambda x: x[1]['count'], reverse=True)
+    records = []
+    for pattern, data in ranked[:top]:
+        record = {'pattern': pattern, 'count': data['count'], 'sample': data['sample']}
+        for key in ('error', 'first', 'last', 'sources'):
+            if data.get(key):
+                record[key] = data[key]
+        if 'minutes' in data:
+            record['minutes'] = dict(sorted(data['minutes'].items()))
+        records.append(record)
+    return records
+
+def print_json(clusters, file_path: str, show_info: bool = False, top: Optional[int] = None,
+               ndjson: bool = False) -> None:
+    """
+    Print clusters as one JSON document, or with `ndjson` as one JSON object per line
+    (a cluster per line, for line-oriented consumers and streaming refreshes).
+    """
+    records = cluster_records(clusters, top)
+    if ndjson:
+        for record in records:
+            print(json.dumps(record))
+        return
+
+    summary = {'source': file_path, 'show_info': show_info}
+    if isinstance(clusters, SpaceSaving):
+        summary.update(engine='exact', approximate=True, capacity=clusters.capacity,
+                       untracked_bound=clusters.untracked_bound, total_patterns=len(clusters))
+    elif isinstance(clusters, DrainMiner):
+        summary.update(engine='drain', similarity=clusters.similarity,
+                       total_patterns=len(clusters.clusters))
+    else:
+        summary.update(engine='exact', total_patterns=len(clusters))
+    summary['clusters'] = records
+    print(json.dumps(summary, indent=2))
+
+def report(clusters, file_path: str, show_info: bool = False, top: Optional[int] = None,
+           output_format: str = 'text') -> None:
+    """Print clusters in the requested output format."""
+    if output_format == 'text':
+        print_summary(clusters, file_path, show_info, top)
+    else:
+        print_json(clusters, file_path, show_info, top, ndjson=output_format == 'ndjson')
+
+# Leading bytes of each supported compressed format
+COMPRESSION_MAGIC = [
+    (re.compile(rb'\x1f\x8b'), 'gzip'),
+    (re.compile(rb'BZh[1-9]'), 'bz2'),  # The block size digit keeps text starting "BZh" plain
+    (re.compile(rb'\xfd7zXZ\x00'), 'xz'),
+    (re.compile(rb'\x28\xb5\x2f\xfd'), 'zstd'),
+]
+
+def detect_compression(file_path: str) -> Optional[str]:
+    """Return the compression format of a file from its magic bytes, or None."""
+    with open(file_path, 'rb') as f:
+        head = f.read(6)
+    for magic, name in COMPRESSION_MAGIC:
+        if magic.match(head):
+            return name
+    return None
+
+class BackgroundReader(io.RawIOBase):
+    """
+    Raw stream that reads `source` on a background thread into a bounded queue of
+    blocks. For a decompressing source this overlaps decompression (which releases
+    the GIL) with the consumer's tokenization.
+    """
+
+    def __init__(self, source, block_size: int = 1024 * 1024, prefetch: int = 8):
+        super().__init__()
+        self._source = source
+        self._blocks: 'queue.Queue' = queue.Queue(maxsize=prefetch)
+        self._pending = memoryview(b'')
+        self._eof = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._fill, args=(block_size,), daemon=True)
+        self._thread.start()
+
+    def _fill(self, block_size: int) -> None:
+        try:
+            while not self._stop.is_set():
+                item = block = self._source.read(block_size)
+                while not self._stop.is_set():
+                    try:
+                        self._blocks.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if not block:
+                    return
+        except Exception as e:  # Surface decompression errors to the reader
+            self._blocks.put(e)
+        finally:
+            self._source.close()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if not self._pending:
+            if self._eof:
+                return 0
+            item = self._blocks.get()
+            if isinstance(item, Exception):
+                raise item
+            if not item:
+                self._eof = True
+                return 0
+            self._pending = memoryview(item)
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def close(self) -> None:
+        if not self.closed:
+            self._stop.set()
+            while self._thread.is_alive():
+                try:
+                    self._blocks.get(timeout=0.1)  # Unblock a pending put
+                except queue.Empty:
+                    pass
+        super().close()
+
+def open_compressed(file_path: str, compression: str):
+    """Open a decompressing binary stream for `file_path`."""
+    if compression == 'gzip':
+        return gzip.open(file_path, 'rb')
+    if compression == 'bz2':
+        return bz2.open(file_path, 'rb')
+    if compression == 'xz':
+        return lzma.open(file_path, 'rb')
+    if compression == 'zstd':
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("zstd input requires the 'zstandard' package (pip install zstandard)")
+        # Concatenated frames (joined rotations, pzstd output) are one stream, as with gzip
+        return zstandard.ZstdDecompressor().stream_reader(open(file_path, 'rb'), closefd=True,
+                                                          read_across_frames=True)
+    raise ValueError(f"Unsupported compression: {compression}")
+
+def open_log(file_path: str, compression: Optional[str] = None) -> TextIO:
+    """
+    Open a log file as text, decompressing gzip/bz2/xz/zstd input on a background
+    thread. Decoding matches plain text mode (UTF-8, invalid bytes ignored).
+    """
+    if compression is None:
+        return open(file_path, 'r', encoding='utf-8', errors='ignore')
+    raw = BackgroundReader(open_compressed(file_path, compression))
+    return io.TextIOWrapper(io.BufferedReader(raw), encoding='utf-8', errors='ignore')
+
+STATE_VERSION = 1
+FINGERPRINT_BYTES = 4096
+
+def default_state_path(file_path: str) -> str:
+    return file_path + '.clusters.json'
+
+def table_to_state(clusters) -> Dict:
+    if isinstance(clusters, dict):
+        return {'kind': 'exact', 'clusters': clusters}
+    return clusters.to_state()
+
+def table_from_state(state: Dict):
+    if state['kind'] == 'space_saving':
+        return SpaceSaving.from_state(state)
+    if state['kind'] == 'drain':
+        return DrainMiner.from_state(state)
+    return dict(state['clusters'])
+
+def file_fingerprint(file_path: str, length: int) -> str:
+    """Hash of the first `length` bytes (capped), to spot a file rewritten in place."""
+    with open(file_path, 'rb') as f:
+        return hashlib.sha256(f.read(min(length, FINGERPRINT_BYTES))).hexdigest()
+
+def last_line_end(file_path: str, start: int, end: int) -> int:
+    """Offset just past the last newline in [start, end), or `start` if there is none."""
+    block = 64 * 1024
+    with open(file_path, 'rb') as f:
+        pos = end
+        while pos > start:
+            lo = max(start, pos - block)
+            f.seek(lo)
+            newline = f.read(pos - lo).rfind(b'\n')
+            if newline >= 0:
+                return lo + newline + 1
+            pos = lo
+    return start
+
+def load_state(state_path: str) -> Optional[Dict]:
+    try:
+        with open(state_path, 'r') as f:
+            state = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return state if state.get('version') == STATE_VERSION else None
+
+def save_state(state_path: str, state: Dict) -> None:
+    """Write the state next to its final path and rename it into place atomically."""
+    tmp_path = f"{state_path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+def resume_point(state: Optional[Dict], file_path: str, stat: os.stat_result,
+                 settings: Dict) -> int:
+    """
+    Offset to resume from, or 0 when the saved state does not describe this file:
+    a different inode (rotated), a shorter file (truncated), a changed prefix
+    (copytruncate then regrown), or different clustering settings.
+    """
+    if not state or state.get('settings') != settings:
+        return 0
+    offset = state.get('offset', 0)
+    if state.get('inode') != stat.st_ino or state.get('device') != stat.st_dev or stat.st_size < offset:
+        return 0
+    if state.get('fingerprint') != file_fingerprint(file_path, offset):
+        return 0
+    return offset
+
+def stdin_lines(poll_interval: float = 0.5) -> Iterator[Optional[str]]:
+    """
+    Yield lines from stdin, or None whenever no line arrived within `poll_interval`
+    so callers can act on time while the pipe is idle. Ends at EOF.
+    """
+    lines: 'queue.Queue[Optional[str]]' = queue.Queue()
+
+    def reader() -> None:
+        for line in sys.stdin:
+            lines.put(line)
+        lines.put(None)  # EOF
+
+    threading.Thread(target=reader, daemon=True).start()
+    while True:
+        try:
+            line = lines.get(timeout=poll_interval)
+        except queue.Empty:
+            yield None
+            continue
+        if line is None:
+            return
+        yield line
+
+def follow_file(file_path: str, poll_interval: float = 0.5) -> Iterator[Optional[str]]:
+    """
+    Yield lines from the start of a file and keep tailing it as it grows (like `tail -F`).
+    Yields None while waiting for new data. Truncation and rotation restart from the top;
+    on rotation, whatever was written to the old file before the switch is read first.
+    """
+    f = open(file_path, 'r', encoding='utf-8', errors='ignore')
+    partial = ''
+    try:
+        while True:
+            line = f.readline()
+            if line:
+                if not line.endswith('\n'):
+                    # Writer is mid-line; wait for the rest
+                    partial += line
+                    continue
+                yield partial + line
+                partial = ''
+                continue
+
+            yield None
+            time.sleep(poll_interval)
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                continue  # Rotated away; wait for the new file
+            if stat.st_ino != os.fstat(f.fileno()).st_ino:
+                # Drain the rotated file: lines written after the last read would be lost
+                lines = (partial + f.read()).split('\n')
+                f.close()
+                f = open(file_path, 'r', encoding='utf-8', errors='ignore')
+                partial = ''
+                for line in lines[:-1]:
+                    yield line + '\n'
+                if lines[-1]:
+                    yield lines[-1]  # Unterminated last line; the writer has moved on
+            elif stat.st_size < f.tell():
+                f.seek(0)
+                partial = ''
+    finally:
+        f.close()
+
+def stream_logs(file_path: str, show_info: bool = False, top: int = 20,
+                refresh_lines: int = 1000, refresh_seconds: float = 10.0,
+                max_clusters: Optional[int] = None, engine: str = 'exact',
+                output_format: str = 'text', timeline: Optional[str] = None) -> None:
+    """
+    Cluster lines incrementally from stdin ('-') or a followed file, printing a
+    refreshed top-K summary every `refresh_lines` lines or `refresh_seconds` seconds.
+    """
+    if file_path == '-':
+        source, title = stdin_lines(), "stdin"
+    else:
+        if not os.path.exists(file_path):
+            print(f"Error: File '{file_path}' not found.")
+            sys.exit(1)
+        source, title = follow_file(file_path), file_path
+
+    clusters = new_clusters(max_clusters, engine)
+    pending = 0
+    refreshed = False
+    last_refresh = time.monotonic()
+
+    try:
+        for line in source:
+            if line is not None:
+                cluster_lines((line,), show_info, clusters, timeline)
+                pending += 1
+
+            now = time.monotonic()
+            if pending and (pending >= refresh_lines or now - last_refresh >= refresh_seconds):
+                report(clusters, title, show_info, top, output_format)
+                sys.stdout.flush()
+                pending = 0
+                refreshed = True
+                last_refresh = now
+    except KeyboardInterrupt:
+        pass
+
+    # Final summary at EOF or on Ctrl-C, unless the last refresh already shows everything
+    if pending or not refreshed:
+        report(clusters, title, show_info, top, output_format)
+
+def cluster_source(file_path: str, show_info: bool = False, workers: int = 1,
+                   use_mmap: bool = False, max_clusters: Optional[int] = None,
+                   engine: str = 'exact', state_path: Optional[str] = None,
+                   timeline: Optional[str] = None):
+    """
+    Cluster one log file (plain or gzip/bz2/xz/zstd compressed) and return the table.
+    With `workers` > 1 the file is split into chunks clustered in separate processes
+    (each through the mmap reader); `use_mmap` selects that reader for a single process.
+    `max_clusters` bounds memory with a Space-Saving sketch (approximate counts), and
+    `engine='drain'` mines `<*>` templates instead of grouping exact masked lines.
+    With `state_path`, the cluster table and read offset are kept in a sidecar file so
+    a rerun only processes bytes appended since the last run. `timeline` ('range' or
+    'minute') records first/last timestamps (and per-minute counts) per cluster.
+    """
+    compression = detect_compression(file_path)
+    if compression and (workers > 1 or use_mmap):
+        print(f"Note: {compression} input is decoded as a single stream; --workers/--mmap ignored.",
+              file=sys.stderr)
+
+    stat = os.stat(file_path)
+    settings = {'show_info': show_info, 'max_clusters': max_clusters, 'engine': engine,
+                'timeline': timeline}
+    state = load_state(state_path) if state_path else None
+    start = resume_point(state, file_path, stat, settings)
+    previous = table_from_state(state['clusters']) if start else None
+
+    if compression:
+        # Compressed archives are not appended to; reuse the table if already read
+        end = stat.st_size
+        if previous is not None and start == end:
+            clusters = new_clusters(max_clusters, engine)
+        else:
+            start, previous = 0, None
+            with open_log(file_path, compression) as f:
+                clusters = cluster_lines(f, show_info, new_clusters(max_clusters, engine), timeline)
+    else:
+        # Leave a partially written last line for the next run
+        end = last_line_end(file_path, start, stat.st_size) if state_path else stat.st_size
+        if workers > 1:
+            clusters = cluster_file_parallel(file_path, show_info, workers, max_clusters, engine,
+                                             start, end, timeline)
+        elif use_mmap or state_path:
+            clusters = cluster_file(file_path, show_info, start, end, max_clusters, engine, timeline)
+        else:
+            with open_log(file_path) as f:
+                clusters = cluster_lines(f, show_info, new_clusters(max_clusters, engine), timeline)
+
+    if previous is not None:
+        # Older lines come first, so the cached table keeps the first-seen samples
+        clusters = merge_clusters(previous, clusters)
+        print(f"Note: resumed from byte {start} of '{file_path}'; processed {end - start} new bytes.",
+              file=sys.stderr)
+
+    if state_path:
+        save_state(state_path, {
+            'version': STATE_VERSION,
+            'path': os.path.abspath(file_path),
+            'inode': stat.st_ino,
+            'device': stat.st_dev,
+            'offset': end,
+            'fingerprint': file_fingerprint(file_path, end),
+            'settings': settings,
+            'clusters': table_to_state(clusters),
+        })
+    # A plain dict (not the defaultdict factory) so the table can cross process boundaries
+    return dict(clusters) if isinstance(clusters, dict) else clusters
+
+def analyze_logs(file_path: str, show_info: bool = False, workers: int = 1,
+                 use_mmap: bool = False, max_clusters: Optional[int] = None,
+                 engine: str = 'exact', state_path: Optional[str] = None,
+                 output_format: str = 'text', timeline: Optional[str] = None) -> None:
+    """
+    Read log file, cluster lines, and print summary as text, JSON or NDJSON.
+    See `cluster_source` for the other options.
+    """
+    try:
+        clusters = cluster_source(file_path, show_info, workers, use_mmap, max_clusters, engine,
+                                  state_path, timeline)
+    except FileNotFoundError:
+        print(f"Error: File '{file_path}' not found.")
+        sys.exit(1)
+    except READ_ERRORS as e:
+        print(f"Error: Could not read '{file_path}': {e}")
+        sys.exit(1)
+
+    report(clusters, file_path, show_info, output_format=output_format)
+
+def expand_sources(specs: Iterable[str]) -> List[str]:
+    """
+    Expand file paths, glob patterns and directories (walked recursively) into a sorted,
+    de-duplicated list of files. Sidecar state files are skipped.
+    """
+    paths: Dict[str, None] = {}
+    for spec in specs:
+        if os.path.isdir(spec):
+            found = [os.path.join(root, name)
+                     for root, _, names in os.walk(spec) for name in names]
+        elif glob.has_magic(spec):
+            found = [path for path in glob.glob(spec, recursive=True) if os.path.isfile(path)]
+        else:
+            found = [spec]  # Missing files are reported when read
+        for path in sorted(found):
+            if not path.endswith('.clusters.json'):
+                paths[path] = None
+    return list(paths)
+
+def source_labels(paths: List[str]) -> Dict[str, str]:
+    """Short names for sources: paths relative to their common directory."""
+    if len(paths) == 1:
+        return {paths[0]: paths[0]}
+    common = os.path.commonpath([os.path.abspath(path) for path in paths])
+    if not os.path.isdir(common):
+        common = os.path.dirname(common)
+    return {path: os.path.relpath(os.path.abspath(path), common) for path in paths}
+
+def merge_attributed(clusters, partial, source: str):
+    """
+    Fold one source's table into `clusters` like `merge_clusters`, also recording how
+    many of each cluster's lines came from `source` under its 'sources' key.
+    """
+    if isinstance(clusters, DrainMiner):
+        # Templates may generalize further when replayed, so attribute to the receiving group
+        for group in partial.groups:
+            target = clusters.add(' '.join(group['tokens']), group['sample'], group['count'])
+            merge_timeline(target, group)
+            sources = target.setdefault('sources', {})
+            sources[source] = sources.get(source, 0) + group['count']
+        return clusters
+
+    if isinstance(clusters, SpaceSaving):
+        clusters.merge(partial)
+        table, partial_table = clusters.clusters, partial.clusters
+    else:
+        table, partial_table = clusters, partial
+        for pattern, data in partial_table.items():
+            if pattern in table:
+                table[pattern]['count'] += data['count']
+                merge_timeline(table[pattern], data)
+            else:
+                table[pattern] = {k: v for k, v in data.items() if k != 'sources'}
+    for pattern, data in partial_table.items():
+        entry = table.get(pattern)
+        if entry is not None:  # A sketch may have pruned it
+            entry.setdefault('sources', {})[source] = data['count']
+    return clusters
+
+def _cluster_source_job(job: Tuple[str, bool, bool, Optional[int], str, bool, Optional[str]]):
+    """Worker entry point: cluster one whole file."""
+    file_path, show_info, use_mmap, max_clusters, engine, use_state, timeline = job
+    state_path = default_state_path(file_path) if use_state else None
+    return cluster_source(file_path, show_info, 1, use_mmap, max_clusters, engine, state_path,
+                          timeline)
+
+def analyze_sources(specs: List[str], show_info: bool = False, workers: int = 1,
+                    use_mmap: bool = False, max_clusters: Optional[int] = None,
+                    engine: str = 'exact', use_state: bool = False,
+                    output_format: str = 'text', timeline: Optional[str] = None) -> None:
+    """
+    Cluster several files (paths, globs or directories) into one table, one file per
+    process when `workers` > 1, and print which sources each pattern came from.
+    Unreadable files are reported and skipped. With `use_state` every file keeps its
+    own sidecar state next to it.
+    """
+    paths = expand_sources(specs)
+    if not paths:
+        print(f"Error: No files match {' '.join(specs)}.")
+        sys.exit(1)
+    if len(paths) == 1:
+        state_path = default_state_path(paths[0]) if use_state else None
+        analyze_logs(paths[0], show_info, workers, use_mmap, max_clusters, engine, state_path,
+                     output_format, timeline)
+        return
+
+    labels = source_labels(paths)
+    jobs = [(path, show_info, use_mmap, max_clusters, engine, use_state, timeline) for path in paths]
+    clusters = new_clusters(max_clusters, engine)
+    if isinstance(clusters, dict):
+        clusters = {}
+    read = 0
+
+    def collect(path, result):
+        nonlocal clusters, read
+        try:
+            partial = result()
+        except READ_ERRORS as e:
+            print(f"Warning: Skipping '{path}': {e}", file=sys.stderr)
+            return
+        clusters = merge_attributed(clusters, partial, labels[path])
+        read += 1
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            futures = [pool.submit(_cluster_source_job, job) for job in jobs]
+            # Merge in path order, which keeps the first-seen samples deterministic
+            for path, future in zip(paths, futures):
+                collect(path, future.result)
+    else:
+        for path, job in zip(paths, jobs):
+            collect(path, lambda: _cluster_source_job(job))
+
+    if not read:
+        print("Error: None of the matched files could be read.")
+        sys.exit(1)
+    report(clusters, f"{read} files", show_info, output_format=output_format)
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Log Clustering Tool for LLM Efficiency")
-    parser.add_argument("file", help="Path to the log file")
+    parser.add_argument("files", nargs="+", metavar="file",
+                        help="Log files (plain, .gz, .bz2, .xz or .zst), globs or directories, "
+                             "or '-' to read from stdin")
     parser.add_argument("--all", action="store_true", help="Include INFO and DEBUG logs")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Cluster in N parallel processes: chunks of one file, or one file "
+                             "per process for several files (default: 1)")
+    parser.add_argument("--mmap", action="store_true",
+                        help="Read through mmap on bytes, decoding only reported samples "
+                             "(faster when most lines survive the INFO/DEBUG filter)")
+    parser.add_argument("--max-clusters", type=int, default=None,
+                        help="Bound memory to N clusters with a Space-Saving sketch (approximate counts)")
+    parser.add_argument("--engine", choices=ENGINES, default="exact",
+                        help="exact: group identical masked lines; drain: mine <*> templates")
+    parser.add_argument("--state", nargs="?", const="", default=None, metavar="PATH",
+                        help="Keep offset and clusters in a sidecar file (default: <file>.clusters.json) "
+                             "and only process newly appended bytes on rerun")
+    parser.add_argument("--format", choices=FORMATS, default="text", dest="output_format",
+                        help="text summary, one JSON document, or one JSON object per cluster "
+                             "per line; JSON records carry first/last timestamps")
+    parser.add_argument("--histogram", action="store_true",
+                        help="JSON formats: add per-minute counts from each line's timestamp")
+    parser.add_argument("-f", "--follow", action="store_true",
+                        help="Keep reading as the file grows and print refreshed summaries")
+    parser.add_argument("--top", type=int, default=20, help="Patterns shown per streaming summary")
+    parser.add_argument("--refresh-lines", type=int, default=1000,
+                        help="Streaming: print a summary every N lines")
+    parser.add_argument("--refresh-seconds", type=float, default=10.0,
+                        help="Streaming: print a summary every N seconds")
     
     args = parser.parse_args()
-    analyze_logs(args.file, args.all)
+    if args.max_clusters is not None and args.max_clusters < 1:
+        parser.error("--max-clusters must be at least 1")
+    if args.engine == 'drain' and args.max_clusters:
+        parser.error("--max-clusters only applies to the exact engine")
+    if args.histogram and args.output_format == 'text':
+        parser.error("--histogram requires --format json or ndjson")
+    timeline = None
+    if args.output_format != 'text':
+        timeline = 'minute' if args.histogram else 'range'
+    single = args.files[0] if len(args.files) == 1 else None
+    if args.follow or '-' in args.files:
+        if single is None:
+            parser.error("--follow and stdin input take a single file")
+        if args.workers > 1:
+            parser.error("--workers cannot be combined with --follow or stdin input")
+        if args.state is not None:
+            parser.error("--state cannot be combined with --follow or stdin input")
+        stream_logs(single, args.all, args.top, args.refresh_lines, args.refresh_seconds,
+                    args.max_clusters, args.engine, args.output_format, timeline)
+    elif single is not None and not os.path.isdir(single) and not glob.has_magic(single):
+        state_path = None
+        if args.state is not None:
+            state_path = args.state or default_state_path(single)
+        analyze_logs(single, args.all, args.workers, args.mmap, args.max_clusters, args.engine,
+                     state_path, args.output_format, timeline)
+    else:
+        if args.state:
+            parser.error("--state PATH takes a single file; use bare --state for per-file sidecars")
+        analyze_sources(args.files, args.all, args.workers, args.mmap, args.max_clusters, args.engine,
+                        args.state is not None, args.output_format, timeline)
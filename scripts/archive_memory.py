@@ -1,79 +1,479 @@
 #!/usr/bin/env python3
 """
 Memory Archiver
-Moves older learnings from `memory.json` to `archived_memory.json` to keep active context small.
+Moves older learnings from `memory.json` to the archive to keep active context small.
+The archive is an append-only log of NDJSON segments (`archived_memory/segment-*.ndjson`)
+listed in a small manifest, so archiving N learnings writes O(N) bytes.
+
+Every writer of `memory.json` (this archiver and agents via `--add-learning`) holds the
+advisory lock `memory.lock`, and all files are replaced atomically (temp file, fsync, rename).
 """
 
 import json
 import sys
 import os
+import math
+import time
+import fcntl
+import random
 import shutil
+import hashlib
+import argparse
+from collections import defaultdict
+from contextlib import contextmanager
 from datetime import datetime, timezone
 
+import search_memory
+
 MEMORY_DIR = ".antigravity/state"
 ACTIVE_FILE = os.path.join(MEMORY_DIR, "memory.json")
 ARCHIVE_FILE = os.path.join(MEMORY_DIR, "archived_memory.json")
-MAX_ACTIVE_LEARNINGS = 10  # Keep only the last 10 learnings in active context
+ACTIVE_TOKEN_BUDGET = 1000  # Keep active learnings within this many (estimated) tokens
+MAX_ACTIVE_LEARNINGS = None  # Optional cap on the number of active learnings, on top of the budget
+CHARS_PER_TOKEN = 4  # Token estimate for serialized JSON
+RECENCY_HALF_LIFE = 10  # A learning's score halves for every 10 newer learnings
+ARCHIVE_VERSION = 1
+SEGMENT_TARGET_BYTES = 8 * 1024 * 1024  # Compaction merges small segments up to this size
+COMPACT_AFTER_SEGMENTS = 16  # Compact once the archive has more segments than this
+DEDUP_INDEX_NAME = "dedup_index.json"  # In the segment directory
+DEDUP_INDEX_VERSION = 2
+MINHASH_PERMUTATIONS = 32
+LSH_BANDS = 8  # 8 bands of 4 rows: pairs above ~0.6 Jaccard similarity become candidates
+NEAR_DUPLICATE_THRESHOLD = 0.8  # Estimated Jaccard similarity of word bigrams needed to merge
+LOCK_NAME = "memory.lock"  # Next to ACTIVE_FILE; never the data file itself, which gets renamed over
+LOCK_TIMEOUT = 30.0  # Seconds to wait for another writer
 
 def ensure_dir(directory):
-    if not os.path.exists(directory):
-        os.makedirs(directory)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
 
 def load_json(filepath):
+    """
+    The parsed file, or {} if it does not exist. A file that exists but does not parse
+    raises ValueError instead of reading as empty, so it is never overwritten with less.
+    """
     if not os.path.exists(filepath):
         return {}
     try:
         with open(filepath, 'r') as f:
             return json.load(f)
-    except json.JSONDecodeError:
-        return {}
+    except json.JSONDecodeError as e:
+        raise ValueError(f"{filepath} is not valid JSON ({e}); refusing to overwrite it") from e
+
+@contextmanager
+def atomic_file(filepath, mode='w'):
+    """
+    Write to a temp file next to `filepath`, fsync it and rename it into place, so readers
+    see either the old or the new file, never a truncated one. Nothing is replaced on error.
+    """
+    directory = os.path.dirname(filepath)
+    ensure_dir(directory)
+    tmp_path = f"{filepath}.tmp.{os.getpid()}"
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filepath)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    # Persist the rename itself
+    dir_fd = os.open(directory or '.', os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
 
 def save_json(filepath, data):
-    ensure_dir(os.path.dirname(filepath))
-    with open(filepath, 'w') as f:
+    with atomic_file(filepath) as f:
         json.dump(data, f, indent=2)
 
-def archive_memory():
-    active_data = load_json(ACTIVE_FILE)
-    if not active_data or 'learnings' not in active_data:
-        print("No active learnings to archive.")
-        return
-
-    learnings = active_data.get('learnings', [])
-    
-    if len(learnings) <= MAX_ACTIVE_LEARNINGS:
-        print(f"Active learnings ({len(learnings)}) are within limit ({MAX_ACTIVE_LEARNINGS}). No archiving needed.")
-        return
-
-    # Split learnings
-    # Newest at the end usually, so we keep the last N
-    # Assuming append-only, so last items are newest
-    items_to_keep = learnings[-MAX_ACTIVE_LEARNINGS:]
-    items_to_archive = learnings[:-MAX_ACTIVE_LEARNINGS]
-
-    # Load archive
-    archive_data = load_json(ARCHIVE_FILE)
-    archived_list = archive_data.get('learnings', [])
-    
-    # Append new archived items
-    archived_list.extend(items_to_archive)
-    
-    # Update structures
-    active_data['learnings'] = items_to_keep
-    
-    # Update archive structure
-    if 'learnings' not in archive_data:
-        archive_data = {'version': '1.0', 'last_updated': datetime.now(timezone.utc).isoformat(), 'learnings': []}
-        archived_list = items_to_archive # Re-assign if new
-    
-    archive_data['learnings'] = archived_list
-    archive_data['last_updated'] = datetime.now(timezone.utc).isoformat()
-
-    # Save both
-    save_json(ACTIVE_FILE, active_data)
-    save_json(ARCHIVE_FILE, archive_data)
-    
-    print(f"✅ Archived {len(items_to_archive)} items. Active memory now has {len(items_to_keep)} items.")
+@contextmanager
+def memory_lock(timeout=LOCK_TIMEOUT):
+    """
+    Exclusive advisory lock for read-modify-write of the memory files. Readers do not
+    need it since writes are atomic. Raises TimeoutError after `timeout` seconds.
+    """
+    path = os.path.join(os.path.dirname(ACTIVE_FILE), LOCK_NAME)
+    ensure_dir(os.path.dirname(path))
+    deadline = time.monotonic() + timeout
+    with open(path, 'a') as f:
+        while True:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"Timed out after {timeout:.0f}s waiting for {path}")
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def add_learning(learning):
+    """Append one learning to active memory under the lock (the write path for agents)."""
+    with memory_lock():
+        active_data = load_json(ACTIVE_FILE)
+        active_data.setdefault('learnings', []).append(learning)
+        active_data['last_updated'] = datetime.now(timezone.utc).isoformat()
+        save_json(ACTIVE_FILE, active_data)
+    return len(active_data['learnings'])
+
+def segment_name(seq):
+    return f"segment-{seq:06d}.ndjson"
+
+def new_manifest():
+    return {'version': ARCHIVE_VERSION, 'segments': [], 'count': 0, 'next_seq': 1,
+            'last_updated': datetime.now(timezone.utc).isoformat()}
+
+def write_segment(segments_dir, name, items):
+    """Write `items` as one NDJSON segment (temp file, fsync, rename). Returns its size in bytes."""
+    path = os.path.join(segments_dir, name)
+    with atomic_file(path) as f:
+        for item in items:
+            f.write(json.dumps(item, separators=(',', ':')) + "\n")
+    return os.path.getsize(path)
+
+def save_manifest(archive_path, manifest):
+    """The manifest is the commit point: segments it does not list are never read."""
+    manifest['last_updated'] = datetime.now(timezone.utc).isoformat()
+    save_json(os.path.join(search_memory.archive_segments_dir(archive_path), search_memory.ARCHIVE_MANIFEST),
+              manifest)
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_seeds = random.Random(1)
+MINHASH_SEEDS = [(_seeds.randrange(1, _MERSENNE_PRIME), _seeds.randrange(_MERSENNE_PRIME))
+                 for _ in range(MINHASH_PERMUTATIONS)]
+
+def dedup_terms(item):
+    return search_memory.tokenize(str(item.get('pattern', '')) + " " + str(item.get('resolution', '')))
+
+def minhash_signature(terms):
+    """MinHash of the word bigrams (or the single word) as hex, 16 bits per permutation; '' if no words."""
+    shingles = {' '.join(pair) for pair in zip(terms, terms[1:])} or set(terms)
+    if not shingles:
+        return ''
+    hashes = [int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+              for shingle in shingles]
+    return ''.join(f"{min((a * h + b) % _MERSENNE_PRIME for h in hashes) & 0xFFFF:04x}" for a, b in MINHASH_SEEDS)
+
+class DedupIndex:
+    """
+    Exact content hashes and MinHash signatures of `pattern` + `resolution` for archived
+    learnings (by archive position), with LSH band buckets so a lookup only compares
+    signatures of likely near-duplicates instead of the whole archive. Also keeps the
+    occurrence count each learning was archived with, which later merges add to.
+    """
+
+    def __init__(self):
+        self.hashes = []
+        self.signatures = []
+        self.occurrences = []
+        self.exact = {}
+        self.buckets = defaultdict(list)
+
+    def _bands(self, signature):
+        width = len(signature) // LSH_BANDS
+        return [f"{band}:{signature[band * width:(band + 1) * width]}" for band in range(LSH_BANDS)] if signature else []
+
+    def add(self, content_hash, signature, occurrences=1):
+        doc = len(self.hashes)
+        self.hashes.append(content_hash)
+        self.signatures.append(signature)
+        self.occurrences.append(occurrences)
+        self.exact.setdefault(content_hash, doc)
+        for band in self._bands(signature):
+            self.buckets[band].append(doc)
+        return doc
+
+    def find(self, content_hash, signature):
+        """Position of the first exact duplicate, else of the most similar near-duplicate, else None."""
+        if content_hash in self.exact:
+            return self.exact[content_hash]
+        best, best_similarity = None, NEAR_DUPLICATE_THRESHOLD
+        for doc in {doc for band in self._bands(signature) for doc in self.buckets.get(band, ())}:
+            other = self.signatures[doc]
+            similarity = sum(signature[i:i + 4] == other[i:i + 4] for i in range(0, len(signature), 4)) * 4 / len(signature)
+            if similarity > best_similarity or (similarity == best_similarity and (best is None or doc < best)):
+                best, best_similarity = doc, similarity
+        return best
+
+    def to_state(self):
+        return {'version': DEDUP_INDEX_VERSION, 'permutations': MINHASH_PERMUTATIONS,
+                'hashes': self.hashes, 'signatures': self.signatures, 'occurrences': self.occurrences}
+
+    @classmethod
+    def from_state(cls, state):
+        index = cls()
+        for content_hash, signature, occurrences in zip(state['hashes'], state['signatures'], state['occurrences']):
+            index.add(content_hash, signature, occurrences)
+        return index
+
+def item_fingerprint(item):
+    terms = dedup_terms(item)
+    return search_memory.content_hash(' '.join(terms))[:16], minhash_signature(terms)
+
+def load_dedup_index(archive_path, manifest):
+    """The dedup index of the archive, rebuilt by streaming the archive if missing or out of date."""
+    path = os.path.join(search_memory.archive_segments_dir(archive_path), DEDUP_INDEX_NAME)
+    try:
+        with open(path, 'r') as f:
+            state = json.load(f)
+        if (state.get('version') == DEDUP_INDEX_VERSION and state.get('permutations') == MINHASH_PERMUTATIONS
+                and len(state['hashes']) == len(state['occurrences']) == manifest['count']):
+            return DedupIndex.from_state(state)
+    except (OSError, ValueError, KeyError):
+        pass
+    index = DedupIndex()
+    for item in search_memory.iter_archive(archive_path, manifest):
+        index.add(*item_fingerprint(item), item.get('occurrences', 1))
+    return index
+
+def save_dedup_index(archive_path, index):
+    path = os.path.join(search_memory.archive_segments_dir(archive_path), DEDUP_INDEX_NAME)
+    with atomic_file(path) as f:
+        json.dump(index.to_state(), f, separators=(',', ':'))
+
+def deduplicate(items, index):
+    """
+    Drop exact and near-duplicates of archived learnings or of earlier `items`, returning
+    (unique items, {archive position: extra occurrences}). Duplicates within `items` are
+    merged into the first one's 'occurrences' (and 'hits'); `index` gains the unique items.
+    """
+    archived = len(index.hashes)
+    unique, merged = [], defaultdict(int)
+    for item in items:
+        fingerprint = item_fingerprint(item)
+        doc = index.find(*fingerprint)
+        if doc is None:
+            index.add(*fingerprint, item.get('occurrences', 1))
+            unique.append(item)
+        elif doc >= archived:
+            kept = unique[doc - archived]
+            kept['occurrences'] = index.occurrences[doc] = kept.get('occurrences', 1) + item.get('occurrences', 1)
+            if item.get('hits'):
+                kept['hits'] = kept.get('hits', 0) + item['hits']
+        else:
+            merged[doc] += item.get('occurrences', 1)
+    return unique, merged
+
+def add_segment(archive_path, manifest, items):
+    name = segment_name(manifest['next_seq'])
+    size = write_segment(search_memory.archive_segments_dir(archive_path), name, items)
+    manifest['segments'].append({'name': name, 'count': len(items), 'bytes': size})
+    manifest['count'] += len(items)
+    manifest['next_seq'] += 1
+
+def migrate_legacy_archive(archive_path):
+    """
+    The archive manifest, converting a legacy single-file `archived_memory.json` into the
+    first segment on first use. The legacy file is kept as `<name>.migrated`.
+    """
+    manifest = search_memory.load_manifest(archive_path)
+    if manifest is not None:
+        return manifest
+    manifest = new_manifest()
+    legacy = load_json(archive_path).get('learnings', [])
+    if legacy:
+        add_segment(archive_path, manifest, legacy)
+    save_manifest(archive_path, manifest)
+    if os.path.exists(archive_path):
+        os.replace(archive_path, archive_path + ".migrated")
+    return manifest
+
+def append_to_archive(items, archive_path=None):
+    """
+    Deduplicate `items` against the archive, append the unique ones as a new segment
+    and index them. Occurrences of duplicates of already archived learnings are counted
+    in the manifest, on top of the count they were archived with. Returns (manifest,
+    number of duplicates merged).
+    """
+    archive_path = archive_path or ARCHIVE_FILE
+    manifest = migrate_legacy_archive(archive_path)
+    previous = (manifest['count'], search_memory.archive_signature(archive_path))
+    dedup_index = load_dedup_index(archive_path, manifest)
+    unique, merged = deduplicate(items, dedup_index)
+
+    occurrences = manifest.setdefault('occurrences', {})
+    for doc, extra in merged.items():
+        occurrences[str(doc)] = occurrences.get(str(doc), dedup_index.occurrences[doc]) + extra
+    if unique:
+        add_segment(archive_path, manifest, unique)
+    save_manifest(archive_path, manifest)
+    save_dedup_index(archive_path, dedup_index)
+
+    # Index only the newly appended entries so search never rescans the archive
+    if not search_memory.append_keyword_index(unique, archive_path, *previous):
+        search_memory.sync_keyword_index(search_memory.load_memory(archive_path), archive_path)
+    return manifest, len(items) - len(unique)
+
+def compact_archive(archive_path=None, target_bytes=SEGMENT_TARGET_BYTES):
+    """
+    Concatenate runs of consecutive small segments into segments of up to `target_bytes`,
+    preserving entry order, and delete segment files the manifest no longer lists.
+    Returns the number of segments removed.
+    """
+    archive_path = archive_path or ARCHIVE_FILE
+    manifest = search_memory.load_manifest(archive_path)
+    if manifest is None:
+        return 0
+    segments_dir = search_memory.archive_segments_dir(archive_path)
+    runs = []
+    for segment in manifest['segments']:
+        if runs and sum(s['bytes'] for s in runs[-1]) + segment['bytes'] <= target_bytes:
+            runs[-1].append(segment)
+        else:
+            runs.append([segment])
+
+    previous = (manifest['count'], search_memory.archive_signature(archive_path))
+    segments = []
+    for run in runs:
+        if len(run) == 1:
+            segments.append(run[0])
+            continue
+        name = segment_name(manifest['next_seq'])
+        manifest['next_seq'] += 1
+        path = os.path.join(segments_dir, name)
+        with atomic_file(path, 'wb') as out:
+            for segment in run:
+                with open(os.path.join(segments_dir, segment['name']), 'rb') as f:
+                    shutil.copyfileobj(f, out)
+        segments.append({'name': name, 'count': sum(s['count'] for s in run), 'bytes': os.path.getsize(path)})
+
+    removed = len(manifest['segments']) - len(segments)
+    if removed:
+        manifest['segments'] = segments
+        save_manifest(archive_path, manifest)
+        # Same entries in the same order: the keyword index stays valid
+        search_memory.append_keyword_index([], archive_path, *previous)
+
+    listed = {segment['name'] for segment in manifest['segments']}
+    for name in os.listdir(segments_dir):
+        if name.startswith("segment-") and name not in listed:
+            os.remove(os.path.join(segments_dir, name))
+    return removed
+
+def estimate_tokens(item):
+    return max(1, math.ceil(len(json.dumps(item, separators=(',', ':'))) / CHARS_PER_TOKEN))
+
+def take_hits(log_path):
+    """
+    Counts per learning key from the search hit log, which is consumed. It is renamed
+    before reading, so searchers appending meanwhile start a fresh log.
+    """
+    folding = log_path + ".folding"
+    try:
+        os.replace(log_path, folding)
+    except FileNotFoundError:
+        return {}
+    counts = {}
+    with open(folding, 'r', errors='ignore') as f:
+        for line in f:
+            key = line.strip()
+            if key:
+                counts[key] = counts.get(key, 0) + 1
+    os.remove(folding)
+    return counts
+
+def tier_score(hits, age):
+    """Value of keeping a learning active: search hits, discounted by how many learnings are newer."""
+    return (1 + hits) * 0.5 ** (age / RECENCY_HALF_LIFE)
+
+def plan_tiers(learnings, token_budget, max_items=None):
+    """
+    Split learnings (oldest first) into (keep, archive), both in their original order.
+    The highest-scoring learnings are kept while they fit in `token_budget` (and `max_items`).
+    """
+    count = len(learnings)
+    tokens = [estimate_tokens(item) for item in learnings]
+    ranked = sorted(range(count), reverse=True,
+                    key=lambda i: (tier_score(learnings[i].get('hits', 0), count - 1 - i), i))
+    keep, used = set(), 0
+    for i in ranked:
+        if max_items is not None and len(keep) >= max_items:
+            break
+        if used + tokens[i] <= token_budget:
+            keep.add(i)
+            used += tokens[i]
+
+    items_to_keep, items_to_archive = [], []
+    for i, item in enumerate(learnings):
+        (items_to_keep if i in keep else items_to_archive).append(item)
+    return items_to_keep, items_to_archive
+
+def archive_memory(token_budget=None, max_items=None):
+    """
+    Move cold learnings to the archive so active memory fits `token_budget` tokens
+    (and at most `max_items` learnings), holding the memory lock. Hits recorded by
+    search_memory are first added to each learning's 'hits' count.
+    """
+    token_budget = ACTIVE_TOKEN_BUDGET if token_budget is None else token_budget
+    max_items = MAX_ACTIVE_LEARNINGS if max_items is None else max_items
+    with memory_lock():
+        active_data = load_json(ACTIVE_FILE)
+        if not active_data or 'learnings' not in active_data:
+            print("No active learnings to archive.")
+            return
+
+        learnings = active_data.get('learnings', [])
+        hits = take_hits(search_memory.hits_log_path(ACTIVE_FILE))
+        for item in learnings:
+            key = search_memory.learning_key(item)
+            if key in hits:
+                item['hits'] = item.get('hits', 0) + hits[key]
+
+        items_to_keep, items_to_archive = plan_tiers(learnings, token_budget, max_items)
+        if not items_to_archive:
+            if hits:
+                save_json(ACTIVE_FILE, active_data)
+            tokens = sum(estimate_tokens(item) for item in learnings)
+            print(f"Active learnings ({len(learnings)}, ~{tokens} tokens) are within budget ({token_budget} tokens). "
+                  "No archiving needed.")
+            return
+
+        # Append to the archive first: a crash before the active file is saved
+        # duplicates these items in the archive instead of losing them
+        manifest, duplicates = append_to_archive(items_to_archive, ARCHIVE_FILE)
+
+        active_data['learnings'] = items_to_keep
+        save_json(ACTIVE_FILE, active_data)
+
+        if len(manifest['segments']) > COMPACT_AFTER_SEGMENTS:
+            compact_archive(ARCHIVE_FILE)
+
+        tokens = sum(estimate_tokens(item) for item in items_to_keep)
+        print(f"✅ Archived {len(items_to_archive)} items ({duplicates} merged as duplicates). "
+              f"Active memory now has {len(items_to_keep)} items (~{tokens} tokens).")
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old learnings out of active memory")
+    parser.add_argument("--token-budget", type=int, default=ACTIVE_TOKEN_BUDGET,
+                        help="Estimated tokens of learnings to keep in active memory")
+    parser.add_argument("--max-items", type=int, default=MAX_ACTIVE_LEARNINGS,
+                        help="Also cap the number of active learnings")
+    parser.add_argument("--compact", action="store_true", help="Only merge small archive segments")
+    parser.add_argument("--add-learning", metavar="JSON",
+                        help="Append one learning (a JSON object) to active memory under the lock")
+    args = parser.parse_args()
+
+    try:
+        if args.add_learning:
+            learning = json.loads(args.add_learning)
+            if not isinstance(learning, dict):
+                raise ValueError("--add-learning expects a JSON object")
+            count = add_learning(learning)
+            print(f"✅ Recorded learning. Active memory now has {count} items.")
+        elif args.compact:
+            with memory_lock():
+                removed = compact_archive(ARCHIVE_FILE)
+            print(f"✅ Compacted archive: {removed} segment(s) merged away.")
+        else:
+            archive_memory(args.token_budget, args.max_items)
+    except (ValueError, TimeoutError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
 
 if __name__ == "__main__":
-    archive_memory()
+    main()
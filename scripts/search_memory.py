@@ -5,27 +5,112 @@ Searches the `archived_memory.json` for relevant past learnings.
 Supports keyword matching (default) and vector similarity (when embeddings available).
 """
 
+import re
 import json
 import sys
 import os
+import math
+import time
+import heapq
+import hashlib
+import signal
+import socket
 import argparse
-from typing import List, Dict, Tuple
+import threading
+import socketserver
+import importlib.util
+from collections import Counter, defaultdict
+from typing import Iterator, List, Dict, Optional, Tuple
 
 MEMORY_DIR = ".antigravity/state"
 ARCHIVE_FILE = os.path.join(MEMORY_DIR, "archived_memory.json")
 ACTIVE_FILE = os.path.join(MEMORY_DIR, "memory.json")
 EMBEDDINGS_FILE = os.path.join(MEMORY_DIR, "embeddings.faiss")
+ARCHIVE_MANIFEST = "manifest.json"  # In the segment directory next to ARCHIVE_FILE
+SEARCH_SOCKET = os.path.join(MEMORY_DIR, "search.sock")
+HITS_LOG_NAME = "search_hits.log"  # Next to the active file; folded into 'hits' by archive_memory.py
+DAEMON_TIMEOUT = 5.0  # Seconds a client waits for the daemon before searching locally
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+ENCODE_BATCH_SIZE = 256  # Texts per forward pass when (re)indexing
+KEYWORD_INDEX_NAME = "keyword_index.json"  # Kept next to the archive it indexes
+KEYWORD_INDEX_VERSION = 1
 
-# Optional imports for vector search
-VECTOR_SEARCH_AVAILABLE = False
-try:
-    from sentence_transformers import SentenceTransformer
-    import numpy as np
-    VECTOR_SEARCH_AVAILABLE = True
-except ImportError:
-    pass
+# BM25 parameters: term-frequency saturation and document-length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+TERM_RE = re.compile(r'[a-z0-9]+')
+OCCURRENCE_BOOST = 0.1  # BM25 score multiplier per e-fold of merged duplicates: 1 + 0.1 * ln(occurrences)
+
+# Approximate nearest-neighbour search: an HNSW graph from FAISS or hnswlib, used once
+# the archive is large enough for brute-force scoring to dominate query latency
+ANN_BACKENDS = {'faiss': 'faiss', 'hnsw': 'hnswlib'}  # backend -> module
+ANN_MIN_ROWS = 50000  # Below this, exact NumPy scoring takes under ~10ms and has perfect recall
+ANN_M = 32  # Graph degree: higher improves recall, costs memory and build time
+ANN_EF_CONSTRUCTION = 200  # Build-time candidate list size
+ANN_EF_SEARCH = 128  # Query-time candidate list size: the recall/latency knob
+
+# Hybrid retrieval: keyword and vector rankings fused with reciprocal rank fusion
+RRF_K = 60  # Rank damping constant from Cormack et al. (2009)
+HYBRID_DEPTH = 20  # Candidates each retriever contributes to the fusion
+HYBRID_BUDGET_MS = 150  # Vector results arriving later than this are dropped
+
+# Optional dependencies for vector search. They are only located here and imported on
+# first use (numpy alone adds ~100ms, torch several seconds), which keeps keyword
+# searches and daemon clients fast to start.
+NUMPY_AVAILABLE = importlib.util.find_spec('numpy') is not None
+VECTOR_SEARCH_AVAILABLE = NUMPY_AVAILABLE and importlib.util.find_spec('sentence_transformers') is not None
+
+np = None
+_model = None
+
+def load_numpy():
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
+
+def archive_segments_dir(archive_path: str) -> str:
+    """Segment log directory of an archive: `archived_memory.json` -> `archived_memory/`."""
+    return os.path.splitext(archive_path)[0]
+
+def load_manifest(archive_path: str) -> Optional[Dict]:
+    """The archive's segment manifest, or None if the archive is still a single JSON file."""
+    try:
+        with open(os.path.join(archive_segments_dir(archive_path), ARCHIVE_MANIFEST), 'r') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+def iter_archive(archive_path: str, manifest: Optional[Dict] = None) -> Iterator[Dict]:
+    """
+    Stream archived learnings from the NDJSON segments listed in the manifest, oldest first.
+    Occurrence counts of learnings that later duplicates were merged into (kept in the
+    manifest, since segments are immutable) are applied as they stream.
+    """
+    manifest = manifest or load_manifest(archive_path) or {'segments': []}
+    occurrences = manifest.get('occurrences', {})
+    segments_dir = archive_segments_dir(archive_path)
+    doc = 0
+    for segment in manifest['segments']:
+        with open(os.path.join(segments_dir, segment['name']), 'rb') as f:
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    if str(doc) in occurrences:
+                        item['occurrences'] = occurrences[str(doc)]
+                    doc += 1
+                    yield item
+
+def archive_signature(archive_path: str) -> Optional[List[int]]:
+    """Size and mtime of whatever changes when the archive does: its manifest, or the legacy file."""
+    manifest_path = os.path.join(archive_segments_dir(archive_path), ARCHIVE_MANIFEST)
+    return file_signature(manifest_path) or file_signature(archive_path)
 
 def load_memory(filepath: str) -> List[Dict]:
+    manifest = load_manifest(filepath)
+    if manifest is not None:
+        return list(iter_archive(filepath, manifest))
     if not os.path.exists(filepath):
         return []
     try:
@@ -37,77 +122,698 @@ def load_memory(filepath: str) -> List[Dict]:
     except json.JSONDecodeError:
         return []
 
-def keyword_search(query: str, learnings: List[Dict], limit: int) -> List[Tuple[int, Dict]]:
-    """Simple keyword-based search."""
-    query_terms = query.lower().split()
-    results = []
-    
+def keyword_text(item) -> str:
+    """The fields keyword search matches against ('' for malformed entries)."""
+    if not isinstance(item, dict):
+        return ''
+    return str(item.get('pattern', '')) + " " + str(item.get('resolution', '')) + " " + str(item.get('category', ''))
+
+def tokenize(text: str) -> List[str]:
+    return TERM_RE.findall(text.lower())
+
+def keyword_index_path(archive_path: str) -> str:
+    return os.path.join(os.path.dirname(archive_path), KEYWORD_INDEX_NAME)
+
+def new_keyword_index() -> Dict:
+    return {'version': KEYWORD_INDEX_VERSION, 'doc_count': 0, 'total_length': 0,
+            'lengths': [], 'hashes': [], 'postings': {}, 'source': None}
+
+def index_documents(index: Dict, learnings: List[Dict]) -> None:
+    """
+    Append learnings to the index; a document's id is its position in the archive.
+    Posting lists are flat `[doc, tf, doc, tf, ...]` arrays, which parse several times
+    faster than nested pairs.
+    """
+    postings = index['postings']
     for item in learnings:
-        if not isinstance(item, dict): 
+        text = keyword_text(item)
+        terms = tokenize(text)
+        doc = index['doc_count']
+        for term, tf in Counter(terms).items():
+            postings.setdefault(term, []).extend((doc, tf))
+        index['lengths'].append(len(terms))
+        index['hashes'].append(content_hash(text)[:16])
+        index['total_length'] += len(terms)
+        index['doc_count'] += 1
+
+def load_keyword_index(path: str) -> Optional[Dict]:
+    try:
+        with open(path, 'r') as f:
+            index = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    return index if index.get('version') == KEYWORD_INDEX_VERSION else None
+
+def save_keyword_index(path: str, index: Dict) -> None:
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+def file_signature(path: str) -> Optional[List[int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+def sync_keyword_index(learnings: List[Dict], archive_path: Optional[str] = None) -> Dict:
+    """
+    The persisted inverted index for the archived `learnings`, brought up to date.
+    An untouched archive file is trusted as is; otherwise entries appended since the
+    last sync are indexed incrementally, and the index is rebuilt only if an already
+    indexed entry changed (checked against per-entry content hashes).
+    """
+    archive_path = archive_path or ARCHIVE_FILE
+    path = keyword_index_path(archive_path)
+    signature = archive_signature(archive_path)
+    index = load_keyword_index(path)
+    if index is not None and index['source'] == signature and index['doc_count'] == len(learnings):
+        return index
+
+    indexed = index['doc_count'] if index is not None else 0
+    if index is None or indexed > len(learnings) or index['hashes'] != [
+            content_hash(keyword_text(item))[:16] for item in learnings[:indexed]]:
+        index = new_keyword_index()
+    index_documents(index, learnings[index['doc_count']:])
+    index['source'] = signature
+    save_keyword_index(path, index)
+    return index
+
+def append_keyword_index(learnings: List[Dict], archive_path: str, previous_count: int,
+                         previous_signature: Optional[List[int]]) -> bool:
+    """
+    Index learnings just appended to the archive, without reading the archive itself.
+    Only applies if the index was in sync before the append; otherwise the next search
+    re-syncs it. Returns whether the index was updated.
+    """
+    path = keyword_index_path(archive_path)
+    index = load_keyword_index(path)
+    if index is None or index['doc_count'] != previous_count or index['source'] != previous_signature:
+        return False
+    index_documents(index, learnings)
+    index['source'] = archive_signature(archive_path)
+    save_keyword_index(path, index)
+    return True
+
+def keyword_search(query: str, learnings: List[Dict], limit: int,
+                   index: Optional[Dict] = None) -> List[Tuple[float, Dict]]:
+    """
+    BM25 keyword search over pattern, resolution and category. `index` covers the first
+    `index['doc_count']` learnings, which are scored from the posting lists of the
+    query terms only; any learnings after them are tokenized on the fly.
+    Learnings merged from duplicates rank higher (see `OCCURRENCE_BOOST`).
+    Ties go to the later (newer) learning.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return []
+
+    indexed = index['doc_count'] if index is not None else 0
+    unindexed = []
+    for doc in range(indexed, len(learnings)):
+        doc_terms = tokenize(keyword_text(learnings[doc]))
+        unindexed.append((doc, Counter(doc_terms), len(doc_terms)))
+
+    doc_count = indexed + len(unindexed)
+    total_length = (index['total_length'] if index is not None else 0) + sum(n for _, _, n in unindexed)
+    avgdl = total_length / doc_count if total_length else 1.0
+
+    scores: Dict[int, float] = defaultdict(float)
+    for term in terms:
+        matches = []
+        if index is not None:
+            flat, lengths = index['postings'].get(term, []), index['lengths']
+            matches = [(doc, tf, lengths[doc]) for doc, tf in zip(flat[::2], flat[1::2])]
+        matches += [(doc, tfs[term], length) for doc, tfs, length in unindexed if term in tfs]
+        if not matches:
             continue
-        text = str(item.get('pattern', '')) + " " + str(item.get('resolution', '')) + " " + str(item.get('category', ''))
-        text_lower = text.lower()
-        score = sum(1 for term in query_terms if term in text_lower)
-        if score > 0:
-            results.append((score, item))
-    
-    results.sort(key=lambda x: x[0], reverse=True)
-    return results[:limit]
+        idf = math.log(1 + (doc_count - len(matches) + 0.5) / (len(matches) + 0.5))
+        for doc, tf, length in matches:
+            scores[doc] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avgdl))
+
+    for doc in scores:
+        item = learnings[doc]
+        occurrences = item.get('occurrences', 1) if isinstance(item, dict) else 1
+        if occurrences > 1:
+            scores[doc] *= 1 + OCCURRENCE_BOOST * math.log(occurrences)
+
+    best = heapq.nlargest(limit, scores.items(), key=lambda x: (x[1], x[0]))
+    return [(score, learnings[doc]) for doc, score in best]
+
+def learning_key(item: Dict) -> str:
+    """Stable key of a learning: its id, or a hash of its searchable text."""
+    return str(item.get('id') or content_hash(keyword_text(item))[:16])
+
+def hits_log_path(active_path: str) -> str:
+    return os.path.join(os.path.dirname(active_path), HITS_LOG_NAME)
+
+def record_hits(results: List[Tuple[float, Dict]], path: str) -> None:
+    """
+    Append the keys of returned learnings to the hit log, one per line. A single O_APPEND
+    write needs no lock against other searchers; failures never fail the search.
+    """
+    keys = [learning_key(item) for _, item in results if isinstance(item, dict)]
+    if not keys:
+        return
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, ''.join(key + '\n' for key in keys).encode('utf-8'))
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+def get_model():
+    """Load the sentence-transformers model once per process."""
+    global _model
+    if _model is None:
+        from sentence_transformers import SentenceTransformer
+        _model = SentenceTransformer(EMBEDDING_MODEL)
+    return _model
+
+def encode_texts(texts: List[str], batch_size: int = ENCODE_BATCH_SIZE) -> 'np.ndarray':
+    """Encode texts into unit-length float32 rows, so a dot product is the cosine similarity."""
+    load_numpy()
+    vectors = get_model().encode(texts, batch_size=batch_size, convert_to_numpy=True,
+                                 normalize_embeddings=True, show_progress_bar=len(texts) > 10 * batch_size)
+    return np.asarray(vectors, dtype=np.float32)
+
+def embedding_text(item: Dict) -> str:
+    return str(item.get('pattern', '')) + " " + str(item.get('resolution', ''))
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def load_embedding_index(path: str) -> Optional[Tuple['np.ndarray', List[str]]]:
+    """Cached (vectors, content hashes), or None if missing, unreadable or from another model."""
+    load_numpy()
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if str(data['model']) != EMBEDDING_MODEL:
+                return None
+            return data['vectors'], [str(h) for h in data['hashes']]
+    except (OSError, ValueError, KeyError):
+        return None
+
+def save_embedding_index(path: str, vectors: 'np.ndarray', hashes: List[str]) -> None:
+    """Write the matrix as an .npz archive next to its final path, then rename it into place."""
+    load_numpy()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, vectors=vectors, hashes=np.array(hashes, dtype=str), model=np.array(EMBEDDING_MODEL))
+    os.replace(tmp_path, path)
+
+def embedding_matrix(learnings: List[Dict], encode=None, path: Optional[str] = None,
+                     rebuild: bool = False) -> 'np.ndarray':
+    """
+    Normalized embedding rows aligned with `learnings`, cached at `EMBEDDINGS_FILE`.
+    Rows are looked up by a hash of the embedded text, so only new or edited learnings
+    are encoded (in one batch); the cache is rewritten only when it changed.
+    `rebuild` ignores the cache and encodes everything.
+    """
+    load_numpy()
+    path = path or EMBEDDINGS_FILE
+    encode = encode or encode_texts
+    texts = [embedding_text(item) for item in learnings]
+    hashes = [content_hash(text) for text in texts]
+
+    cached = None if rebuild else load_embedding_index(path)
+    rows: Dict[str, 'np.ndarray'] = {}
+    if cached is not None:
+        vectors, cached_hashes = cached
+        if cached_hashes == hashes:
+            return vectors
+        rows = {h: vectors[i] for i, h in enumerate(cached_hashes)}
+
+    missing = {h: text for h, text in zip(hashes, texts) if h not in rows}  # Also de-duplicates
+    if missing:
+        rows.update(zip(missing, encode(list(missing.values()))))
+    if not hashes:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    matrix = np.stack([rows[h] for h in hashes]).astype(np.float32, copy=False)
+    save_embedding_index(path, matrix, hashes)
+    return matrix
+
+def ann_available(backend: str) -> bool:
+    return NUMPY_AVAILABLE and importlib.util.find_spec(ANN_BACKENDS[backend]) is not None
+
+def resolve_backend(requested: str) -> str:
+    """'auto' picks the first installed ANN backend; anything not installed falls back to 'exact'."""
+    if requested == 'auto':
+        return next((backend for backend in ANN_BACKENDS if ann_available(backend)), 'exact')
+    if requested in ANN_BACKENDS and not ann_available(requested):
+        return 'exact'
+    return requested
+
+def ann_index_path(backend: str, embeddings_path: Optional[str] = None) -> str:
+    return f"{os.path.splitext(embeddings_path or EMBEDDINGS_FILE)[0]}.{backend}.ann"
+
+def matrix_digest(items: List[Dict]) -> str:
+    """Identifies the embedding rows (content and order) an ANN index was built from."""
+    digest = hashlib.sha1()
+    for item in items:
+        digest.update(content_hash(embedding_text(item)).encode('ascii'))
+    return digest.hexdigest()
+
+class AnnIndex:
+    """
+    HNSW graph over the normalized embedding rows with an inner-product metric, built
+    with FAISS (`IndexHNSWFlat`) or hnswlib. Metadata (digest of the rows, build
+    parameters) is kept in a JSON file next to the index.
+    """
+
+    def __init__(self, backend: str, index, meta: Dict):
+        self.backend = backend
+        self.index = index
+        self.meta = meta
+
+    @classmethod
+    def build(cls, backend: str, matrix: 'np.ndarray', digest: str, m: int = ANN_M,
+              ef_construction: int = ANN_EF_CONSTRUCTION) -> 'AnnIndex':
+        load_numpy()
+        rows, dim = matrix.shape
+        vectors = np.ascontiguousarray(matrix, dtype=np.float32)
+        if backend == 'faiss':
+            import faiss
+            index = faiss.IndexHNSWFlat(dim, m, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = ef_construction
+            index.add(vectors)
+        else:
+            import hnswlib
+            index = hnswlib.Index(space='ip', dim=dim)
+            index.init_index(max_elements=rows, ef_construction=ef_construction, M=m)
+            index.add_items(vectors, np.arange(rows))
+        meta = {'backend': backend, 'digest': digest, 'rows': rows, 'dim': dim,
+                'm': m, 'ef_construction': ef_construction}
+        return cls(backend, index, meta)
 
-def vector_search(query: str, learnings: List[Dict], limit: int) -> List[Tuple[float, Dict]]:
-    """Vector similarity search using sentence-transformers."""
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.tmp.{os.getpid()}"
+        if self.backend == 'faiss':
+            import faiss
+            faiss.write_index(self.index, tmp_path)
+        else:
+            self.index.save_index(tmp_path)
+        os.replace(tmp_path, path)
+        with open(tmp_path, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, path + '.json')
+
+    @classmethod
+    def load(cls, path: str, backend: str, digest: str) -> Optional['AnnIndex']:
+        """The saved index, or None if missing or built from other rows or by another backend."""
+        try:
+            with open(path + '.json', 'r') as f:
+                meta = json.load(f)
+            if meta.get('backend') != backend or meta.get('digest') != digest:
+                return None
+            if backend == 'faiss':
+                import faiss
+                index = faiss.read_index(path)
+            else:
+                import hnswlib
+                index = hnswlib.Index(space='ip', dim=meta['dim'])
+                index.load_index(path, max_elements=meta['rows'])
+        except (OSError, RuntimeError, ValueError, KeyError):
+            return None
+        return cls(backend, index, meta)
+
+    def search(self, vector: 'np.ndarray', k: int, ef_search: int = ANN_EF_SEARCH) -> Tuple['np.ndarray', 'np.ndarray']:
+        """(row ids, inner products) of about the `k` nearest rows, best first."""
+        load_numpy()
+        k = min(k, self.meta['rows'])
+        ef = max(ef_search, k)  # The candidate list must hold at least k results
+        query = np.ascontiguousarray(vector, dtype=np.float32).reshape(1, -1)
+        if self.backend == 'faiss':
+            self.index.hnsw.efSearch = ef
+            scores, ids = self.index.search(query, k)
+            found = ids[0] >= 0
+            return ids[0][found], scores[0][found]
+        self.index.set_ef(ef)
+        ids, distances = self.index.knn_query(query, k=k)
+        return ids[0].astype(np.intp), 1.0 - distances[0]  # hnswlib 'ip' distance is 1 - dot
+
+def load_ann_index(backend: str, matrix: 'np.ndarray', digest: str, path: Optional[str] = None,
+                   m: int = ANN_M, ef_construction: int = ANN_EF_CONSTRUCTION) -> AnnIndex:
+    """The persisted ANN index for these rows, built (and saved) if missing or stale."""
+    path = path or ann_index_path(backend)
+    ann = AnnIndex.load(path, backend, digest)
+    if ann is None:
+        print(f"Building {backend} HNSW index over {len(matrix)} embeddings...", file=sys.stderr)
+        ann = AnnIndex.build(backend, matrix, digest, m, ef_construction)
+        ann.save(path)
+    return ann
+
+def vector_search(query: str, learnings: List[Dict], limit: int,
+                  matrix: Optional['np.ndarray'] = None, backend: str = 'exact',
+                  ef_search: int = ANN_EF_SEARCH, ann: Optional[AnnIndex] = None) -> List[Tuple[float, Dict]]:
+    """
+    Vector similarity search using sentence-transformers and the cached embedding matrix
+    (or `matrix`, rows aligned with the dict entries of `learnings`, when already loaded).
+    With an ANN `backend` ('auto', 'faiss' or 'hnsw') installed and at least
+    `ANN_MIN_ROWS` learnings, candidates come from the HNSW graph (or `ann`) instead of
+    scoring every row; `ef_search` trades latency for recall.
+    """
     if not VECTOR_SEARCH_AVAILABLE:
         return []
-    
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    query_embedding = model.encode([query])[0]
-    
-    results = []
-    for item in learnings:
-        if not isinstance(item, dict):
-            continue
-        text = str(item.get('pattern', '')) + " " + str(item.get('resolution', ''))
-        item_embedding = model.encode([text])[0]
-        
-        # Cosine similarity
-        similarity = np.dot(query_embedding, item_embedding) / (np.linalg.norm(query_embedding) * np.linalg.norm(item_embedding))
-        results.append((float(similarity), item))
-    
-    results.sort(key=lambda x: x[0], reverse=True)
-    return results[:limit]
-
-def search_memory(query: str, limit: int = 5, use_vector: bool = False) -> None:
-    """Search both active and archived memory for learnings matching the query."""
-    active_learnings = load_memory(ACTIVE_FILE)
-    archived_learnings = load_memory(ARCHIVE_FILE)
-    all_learnings = active_learnings + archived_learnings
-    
-    if use_vector and VECTOR_SEARCH_AVAILABLE:
-        print("🔍 Using Vector Search (semantic matching)")
-        results = vector_search(query, all_learnings, limit)
-        score_label = "Similarity"
-    else:
-        if use_vector and not VECTOR_SEARCH_AVAILABLE:
-            print("⚠️ Vector search requested but sentence-transformers not installed. Falling back to keyword search.")
-        print("🔍 Using Keyword Search")
-        results = keyword_search(query, all_learnings, limit)
-        score_label = "Score"
-    
+
+    items = [item for item in learnings if isinstance(item, dict)]
+    if not items:
+        return []
+
+    if matrix is None:
+        matrix = embedding_matrix(items)
+    query_vector = encode_texts([query])[0]
+
+    backend = resolve_backend(backend)
+    if backend != 'exact' and len(items) >= ANN_MIN_ROWS:
+        if ann is None:
+            ann = load_ann_index(backend, matrix, matrix_digest(items))
+        ids, scores = ann.search(query_vector, limit, ef_search)
+        return [(float(score), items[i]) for i, score in zip(ids, scores)]
+
+    scores = matrix @ query_vector  # Cosine similarity for every learning at once
+    return [(float(scores[i]), items[i]) for i in top_k(scores, limit)]
+
+def top_k(scores: 'np.ndarray', k: int) -> 'np.ndarray':
+    """Indices of the `k` highest scores, best first, without sorting the whole array."""
+    load_numpy()
+    if k >= len(scores):
+        return np.argsort(-scores, kind='stable')
+    if k <= 0:
+        return np.array([], dtype=np.intp)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+def build_index(batch_size: int = ENCODE_BATCH_SIZE, backend: str = 'exact',
+                m: int = ANN_M, ef_construction: int = ANN_EF_CONSTRUCTION) -> None:
+    """
+    Re-encode every learning in batches of `batch_size` and rewrite the embedding cache,
+    then (re)build the ANN index for `backend` when the archive is large enough to use it.
+    """
+    if not VECTOR_SEARCH_AVAILABLE:
+        print("❌ Indexing requires sentence-transformers and numpy.")
+        sys.exit(1)
+
+    items = [item for item in load_memory(ACTIVE_FILE) + load_memory(ARCHIVE_FILE) if isinstance(item, dict)]
+    start = time.perf_counter()
+    get_model()
+    loaded = time.perf_counter()
+    matrix = embedding_matrix(items, lambda texts: encode_texts(texts, batch_size), rebuild=True)
+    done = time.perf_counter()
+    print(f"✅ Indexed {len(items)} learnings ({matrix.shape[1] if matrix.size else 0} dims) into {EMBEDDINGS_FILE}")
+    print(f"   Model load: {loaded - start:.1f}s, encoding: {done - loaded:.1f}s "
+          f"({len(items) / max(done - loaded, 1e-9):,.0f} learnings/sec)")
+
+    backend = resolve_backend(backend)
+    if backend != 'exact' and len(items) >= ANN_MIN_ROWS:
+        ann = AnnIndex.build(backend, matrix, matrix_digest(items), m, ef_construction)
+        ann.save(ann_index_path(backend))
+        print(f"✅ Built {backend} HNSW index (M={m}, efConstruction={ef_construction}) "
+              f"in {time.perf_counter() - done:.1f}s")
+
+def print_results(query: str, results: List[Tuple[float, Dict]], limit: int, score_label: str) -> None:
     print(f"=== Memory Search Results for '{query}' ===")
     print(f"Found {len(results)} matches. Showing top {limit}.\n")
     
     for i, (score, item) in enumerate(results, 1):
-        score_display = f"{score:.2f}" if isinstance(score, float) else str(score)
+        # RRF scores are at most 2 / (RRF_K + 1), so they need more digits
+        score_display = f"{score:.{4 if score_label == 'RRF' else 2}f}" if isinstance(score, float) else str(score)
         print(f"{i}. [{score_label}: {score_display}] {item.get('id', 'N/A')} ({item.get('category', 'General')})")
         print(f"   Pattern: {item.get('pattern', 'N/A')}")
         print(f"   Resolution: {item.get('resolution', 'N/A')}")
+        if item.get('occurrences', 1) > 1:
+            print(f"   Seen: {item['occurrences']} times")
         print("-" * 40)
 
+class MemoryService:
+    """
+    Learnings, keyword index and embedding matrix kept in memory for repeated queries.
+    Both memory files are re-read (and the indexes refreshed) whenever their size or
+    mtime changes, checked on every query.
+    """
+
+    def __init__(self, active_path: Optional[str] = None, archive_path: Optional[str] = None):
+        self.active_path = active_path or ACTIVE_FILE
+        self.archive_path = archive_path or ARCHIVE_FILE
+        self._lock = threading.Lock()
+        # Serializes slow matrix/ANN builds without holding up refreshes and keyword queries
+        self._build_lock = threading.Lock()
+        self._signatures = None
+        self.active: List[Dict] = []
+        self.archived: List[Dict] = []
+        self.index: Optional[Dict] = None
+        self._matrix = None
+        self._ann: Dict[str, AnnIndex] = {}
+        self.refresh()
+
+    def refresh(self) -> bool:
+        """Reload the memory files if they changed since the last load."""
+        signatures = [file_signature(self.active_path), archive_signature(self.archive_path)]
+        with self._lock:
+            if signatures == self._signatures:
+                return False
+            # Signatures are taken before reading, so a write racing the load is
+            # picked up again on the next query
+            self.active = load_memory(self.active_path)
+            self.archived = load_memory(self.archive_path)
+            self.index = sync_keyword_index(self.archived, self.archive_path)
+            self._matrix = None
+            self._ann = {}
+            self._signatures = signatures
+            return True
+
+    def search(self, query: str, limit: int = 5, use_vector: bool = False, backend: str = 'exact',
+               ef_search: int = ANN_EF_SEARCH, hybrid: bool = False,
+               budget_ms: float = HYBRID_BUDGET_MS) -> Tuple[List[Tuple[float, Dict]], str]:
+        """(results, mode), mode being 'hybrid', 'vector' or 'keyword'."""
+        self.refresh()
+        with self._lock:
+            active, archived, index = self.active, self.archived, self.index
+
+        def keyword(n: int) -> List[Tuple[float, Dict]]:
+            return keyword_search(query, archived + active, n, index)
+
+        def vector(n: int) -> List[Tuple[float, Dict]]:
+            return self._vector_search(query, n, backend, ef_search)
+
+        if VECTOR_SEARCH_AVAILABLE and hybrid:
+            results, mode = hybrid_search(keyword, vector, limit, budget_ms)
+        elif VECTOR_SEARCH_AVAILABLE and use_vector:
+            results, mode = vector(limit), 'vector'
+        else:
+            results, mode = keyword(limit), 'keyword'
+        # Hit counts feed the active-memory tiering in archive_memory.py
+        record_hits(results, hits_log_path(self.active_path))
+        return results, mode
+
+    def _vector_search(self, query: str, limit: int, backend: str, ef_search: int) -> List[Tuple[float, Dict]]:
+        backend = resolve_backend(backend)
+        with self._build_lock:
+            with self._lock:
+                # The matrix belongs to the current snapshot, so all are read together
+                active, archived, matrix, ann = self.active, self.archived, self._matrix, self._ann.get(backend)
+            items = [item for item in active + archived if isinstance(item, dict)]
+            if matrix is None and items:
+                matrix = embedding_matrix(items)
+            if backend != 'exact' and len(items) >= ANN_MIN_ROWS and ann is None:
+                ann = load_ann_index(backend, matrix, matrix_digest(items))
+            with self._lock:
+                # Unless a refresh replaced the snapshot while building
+                if self.active is active and self.archived is archived:
+                    self._matrix = matrix
+                    if ann is not None:
+                        self._ann[backend] = ann
+        return vector_search(query, active + archived, limit, matrix, backend, ef_search, ann)
+
+def reciprocal_rank_fusion(rankings: List[List[Tuple[float, Dict]]], k: int = RRF_K) -> List[Tuple[float, Dict]]:
+    """
+    Fuse rankings by summing 1 / (k + rank) per learning. Scores are ignored, so BM25
+    and cosine scales need no calibration; ties keep the order of the first ranking.
+    """
+    fused: Dict[int, List] = {}
+    for ranking in rankings:
+        for rank, (_, item) in enumerate(ranking, 1):
+            entry = fused.setdefault(id(item), [0.0, item])
+            entry[0] += 1.0 / (k + rank)
+    return sorted(((score, item) for score, item in fused.values()), key=lambda x: x[0], reverse=True)
+
+def hybrid_search(keyword, vector, limit: int,
+                  budget_ms: Optional[float] = HYBRID_BUDGET_MS) -> Tuple[List[Tuple[float, Dict]], str]:
+    """
+    Run the `keyword` and `vector` retrievers (callables taking a result count)
+    concurrently and fuse their rankings. Keyword results are awaited; vector results
+    are used only if they are ready within `budget_ms` of the start, otherwise the
+    keyword ranking is returned alone (mode 'keyword'). `budget_ms=None` waits for both.
+    """
+    depth = max(limit, HYBRID_DEPTH)
+    start = time.perf_counter()
+    outcome: Dict[str, object] = {}
+
+    def run_vector():
+        try:
+            outcome['results'] = vector(depth)
+        except BaseException as e:  # Re-raised by the caller if it is still waiting
+            outcome['error'] = e
+
+    # A daemon thread: a late retrieval keeps running for a daemon (which reuses the
+    # model/matrix it loads) but does not hold up the exit of a one-shot process
+    retriever = threading.Thread(target=run_vector, name='vector-retriever', daemon=True)
+    retriever.start()
+    keyword_results = keyword(depth)
+    remaining = None if budget_ms is None else max(budget_ms / 1000 - (time.perf_counter() - start), 0)
+    retriever.join(remaining)
+    if retriever.is_alive():
+        return keyword_results[:limit], 'keyword'
+    if 'error' in outcome:
+        raise outcome['error']
+    return reciprocal_rank_fusion([keyword_results, outcome['results']])[:limit], 'hybrid'
+
+class _SearchHandler(socketserver.StreamRequestHandler):
+    """
+    One JSON request per line: {"query", "limit", "vector", "backend", "ef_search",
+    "hybrid", "budget_ms"} -> {"mode", "results"}.
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                results, mode = self.server.service.search(
+                    str(request['query']), int(request.get('limit', 5)), bool(request.get('vector')),
+                    str(request.get('backend', 'exact')), int(request.get('ef_search', ANN_EF_SEARCH)),
+                    bool(request.get('hybrid')), float(request.get('budget_ms', HYBRID_BUDGET_MS)))
+                response = {'mode': mode, 'results': [[score, item] for score, item in results]}
+            except (ValueError, KeyError, TypeError) as e:
+                response = {'error': str(e)}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+class SearchServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, service: MemoryService):
+        self.service = service
+        super().__init__(socket_path, _SearchHandler)
+
+def serve(socket_path: Optional[str] = None) -> None:
+    """Run the search daemon on a Unix socket until interrupted."""
+    socket_path = socket_path or SEARCH_SOCKET
+    if os.path.exists(socket_path):
+        if query_daemon("", 1, False, socket_path) is not None:
+            print(f"❌ A search daemon is already listening on {socket_path}")
+            sys.exit(1)
+        os.remove(socket_path)  # Left behind by a daemon that did not shut down cleanly
+    os.makedirs(os.path.dirname(socket_path) or '.', exist_ok=True)
+
+    # Exit through the cleanup below on `kill` as well as Ctrl-C
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    service = MemoryService()
+    if VECTOR_SEARCH_AVAILABLE:
+        get_model()  # Pay the model load once, before the first query
+    with SearchServer(socket_path, service) as server:
+        print(f"🧠 Serving {len(service.active) + len(service.archived)} learnings on {socket_path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(socket_path)
+
+def query_daemon(query: str, limit: int, use_vector: bool, socket_path: Optional[str] = None,
+                 backend: str = 'exact', ef_search: int = ANN_EF_SEARCH, hybrid: bool = False,
+                 budget_ms: float = HYBRID_BUDGET_MS) -> Optional[Tuple[List[Tuple[float, Dict]], str]]:
+    """Ask a running daemon; None if there is none (or it does not answer in time)."""
+    socket_path = socket_path or SEARCH_SOCKET
+    request = {'query': query, 'limit': limit, 'vector': use_vector, 'backend': backend,
+               'ef_search': ef_search, 'hybrid': hybrid, 'budget_ms': budget_ms}
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(DAEMON_TIMEOUT)
+            sock.connect(socket_path)
+            sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+            with sock.makefile('rb') as reply:
+                response = json.loads(reply.readline())
+    except (OSError, ValueError):
+        return None
+    if 'error' in response:
+        return None
+    return [(score, item) for score, item in response['results']], response['mode']
+
+def search_memory(query: str, limit: int = 5, use_vector: bool = False,
+                  socket_path: Optional[str] = None, backend: str = 'exact',
+                  ef_search: int = ANN_EF_SEARCH, hybrid: bool = False,
+                  budget_ms: float = HYBRID_BUDGET_MS) -> None:
+    """
+    Search both active and archived memory for learnings matching the query.
+    With `socket_path`, a running search daemon answers if there is one. `backend`
+    and `ef_search` select approximate vector search (see `vector_search`); `hybrid`
+    fuses keyword and vector rankings (see `hybrid_search`).
+    """
+    answer = None
+    if socket_path:
+        answer = query_daemon(query, limit, use_vector, socket_path, backend, ef_search, hybrid, budget_ms)
+    if answer is not None:
+        results, mode = answer
+    else:
+        results, mode = MemoryService().search(query, limit, use_vector, backend, ef_search, hybrid, budget_ms)
+
+    if (use_vector or hybrid) and not VECTOR_SEARCH_AVAILABLE:
+        print("⚠️ Vector search requested but sentence-transformers not installed. Falling back to keyword search.")
+    elif hybrid and mode == 'keyword':
+        print(f"⚠️ Vector results missed the {budget_ms:.0f}ms budget. Showing keyword results only.")
+    if mode == 'hybrid':
+        print("🔍 Using Hybrid Search (BM25 + vector, reciprocal rank fusion)")
+        score_label = "RRF"
+    elif mode == 'vector':
+        print("🔍 Using Vector Search (semantic matching)")
+        score_label = "Similarity"
+    else:
+        print("🔍 Using Keyword Search (BM25)")
+        score_label = "BM25"
+    print_results(query, results, limit, score_label)
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Search Agent Memory")
-    parser.add_argument("query", help="Search keywords (e.g. 'terraform lock state')")
+    parser.add_argument("query", nargs="?", help="Search keywords (e.g. 'terraform lock state')")
     parser.add_argument("--limit", type=int, default=5, help="Max results to return")
     parser.add_argument("--vector", action="store_true", help="Use vector search (requires sentence-transformers)")
+    parser.add_argument("--hybrid", action="store_true",
+                        help="Fuse keyword and vector rankings (vector results only if within --budget-ms)")
+    parser.add_argument("--budget-ms", type=float, default=HYBRID_BUDGET_MS,
+                        help="Hybrid: how long to wait for vector results")
+    parser.add_argument("--ann", choices=('auto', 'exact') + tuple(ANN_BACKENDS), default="auto",
+                        help=f"Vector backend: HNSW via faiss/hnswlib for archives of {ANN_MIN_ROWS}+ "
+                             "learnings, exact otherwise or when not installed (default: auto)")
+    parser.add_argument("--ef-search", type=int, default=ANN_EF_SEARCH,
+                        help="ANN candidate list size: higher = better recall, slower queries")
+    parser.add_argument("--ann-m", type=int, default=ANN_M, help="ANN graph degree (--reindex)")
+    parser.add_argument("--ann-ef-construction", type=int, default=ANN_EF_CONSTRUCTION,
+                        help="ANN build-time candidate list size (--reindex)")
+    parser.add_argument("--reindex", action="store_true",
+                        help="Re-encode all learnings into the embedding cache and exit")
+    parser.add_argument("--batch-size", type=int, default=ENCODE_BATCH_SIZE,
+                        help="Texts per encoder batch when reindexing")
+    parser.add_argument("--serve", action="store_true",
+                        help="Run a daemon keeping memory, indexes and model loaded")
+    parser.add_argument("--socket", default=SEARCH_SOCKET,
+                        help=f"Daemon Unix socket (default: {SEARCH_SOCKET})")
+    parser.add_argument("--no-daemon", action="store_true",
+                        help="Search in this process even if a daemon is running")
     
     args = parser.parse_args()
-    search_memory(args.query, args.limit, args.vector)
+    if args.serve:
+        serve(args.socket)
+    elif args.reindex:
+        build_index(args.batch_size, args.ann, args.ann_m, args.ann_ef_construction)
+    elif args.query is None:
+        parser.error("a query is required unless --reindex or --serve is given")
+    else:
+        search_memory(args.query, args.limit, args.vector, None if args.no_daemon else args.socket,
+                      args.ann, args.ef_search, args.hybrid, args.budget_ms)
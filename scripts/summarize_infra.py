@@ -3,12 +3,45 @@
 Terraform State Summarizer
 Parses terraform.tfstate or uses `terraform show -json` to produce a 
 lightweight resource graph for LLM context.
+With --stream, resources are decoded one at a time as the state is read,
+so memory stays proportional to one resource instead of the whole state.
+Summaries are cached by state content (lineage/serial or a hash), so repeat
+calls on an unchanged state skip `terraform show -json` (--no-cache bypasses).
+Several directories, or roots scanned for workspaces, are summarized in a
+bounded process pool into one graph with a section per workspace.
+With --graph, resources are emitted as an adjacency list of `depends_on` edges,
+optionally index-encoded, transitively reduced and collapsed per type.
+With --since, only the resources added, removed or changed relative to an
+earlier summary (saved with --save) are emitted.
 """
 
+import re
 import json
 import sys
+import codecs
+import hashlib
+import time
+import tempfile
+import argparse
 import subprocess
 import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+STREAM_CHUNK_SIZE = 1 << 20  # Bytes read per step in --stream mode
+# Structural tokens of the JSON skeleton; group 1 is empty for a string cut off by the chunk end
+_STREAM_TOKEN_RE = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*(")?|[{}\[\]:,]', re.DOTALL)
+_decoder = json.JSONDecoder()
+
+DEFAULT_JOBS = min(8, os.cpu_count() or 1)  # Concurrent workspaces (terraform processes)
+
+CACHE_DIR = os.path.join(".antigravity", "cache", "summarize_infra")
+CACHE_VERSION = 2  # Bump when the summary format changes
+CACHE_MAX_BYTES = 64 * 1024 * 1024  # Least recently used summaries are evicted beyond this
+STATE_HEAD_BYTES = 64 * 1024  # `serial` and `lineage` are top-level keys at the start of a state
+SERIAL_RE = re.compile(rb'"serial"\s*:\s*(\d+)')
+LINEAGE_RE = re.compile(rb'"lineage"\s*:\s*"([^"]+)"')
+INSTANCE_KEY_RE = re.compile(r'\[(?:"(?:[^"\\]|\\.)*"|[^\]"]*)\]')  # [0] or ["key"], whose quotes may hold ] or .
 
 def get_terraform_output(tf_dir):
     """Run terraform show -json to get state."""
@@ -37,6 +70,231 @@ def get_terraform_output(tf_dir):
         print("Error analyzing terraform output.")
         return None
 
+@contextmanager
+def open_terraform_output(tf_dir):
+    """
+    Like `get_terraform_output`, but yields the state as an unparsed byte stream (or None):
+    the state file itself, or the stdout pipe of `terraform show -json`.
+    """
+    if not os.path.exists(os.path.join(tf_dir, ".terraform")):
+        print("Note: .terraform directory not found. Assuming offline or uninitialized.")
+        state_path = os.path.join(tf_dir, "terraform.tfstate")
+        if os.path.exists(state_path):
+            with open(state_path, 'rb') as f:
+                yield f
+        else:
+            yield None
+        return
+
+    # stderr goes to a file so a chatty terraform cannot block on a full pipe
+    with tempfile.TemporaryFile() as stderr:
+        proc = subprocess.Popen(["terraform", "show", "-json"], cwd=tf_dir,
+                                stdout=subprocess.PIPE, stderr=stderr)
+        try:
+            yield proc.stdout
+        finally:
+            proc.stdout.close()
+            returncode = proc.wait()
+        if returncode != 0:
+            stderr.seek(0)
+            raise subprocess.CalledProcessError(returncode, proc.args,
+                                                stderr=stderr.read().decode('utf-8', errors='replace'))
+
+def configured_backend(tf_dir):
+    """The backend type `terraform init` recorded in .terraform/terraform.tfstate, or None."""
+    try:
+        with open(os.path.join(tf_dir, ".terraform", "terraform.tfstate")) as f:
+            return (json.load(f).get('backend') or {}).get('type')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def selected_workspace(tf_dir):
+    """The Terraform workspace selected in `tf_dir` (recorded in .terraform/environment)."""
+    try:
+        with open(os.path.join(tf_dir, ".terraform", "environment")) as f:
+            return f.read().strip() or 'default'
+    except OSError:
+        return 'default'
+
+def local_state_path(tf_dir):
+    """
+    The state file of the selected workspace with the local backend, or None. A
+    terraform.tfstate left behind after migrating to a remote backend is not used.
+    """
+    if configured_backend(tf_dir) not in (None, 'local'):
+        return None
+    workspace = selected_workspace(tf_dir)
+    if workspace == 'default':
+        path = os.path.join(tf_dir, "terraform.tfstate")
+    else:
+        path = os.path.join(tf_dir, "terraform.tfstate.d", workspace, "terraform.tfstate")
+    return path if os.path.exists(path) else None
+
+def state_identity(head):
+    """`lineage:serial` from the first bytes of a state, or None. Terraform bumps the serial on every write."""
+    serial, lineage = SERIAL_RE.search(head), LINEAGE_RE.search(head)
+    if not (serial and lineage):
+        return None
+    return f"{lineage.group(1).decode('utf-8', errors='replace')}:{serial.group(1).decode()}"
+
+def state_cache_key(tf_dir):
+    """
+    Content key of the state `tf_dir` would summarize, without reading all of it:
+    lineage, serial and size of a local state file (a full hash if it has no serial),
+    or the lineage and serial at the head of `terraform state pull` for remote backends.
+    None if the state cannot be identified, which disables caching.
+    """
+    path = local_state_path(tf_dir)
+    if path is not None:
+        with open(path, 'rb') as f:
+            identity = state_identity(f.read(STATE_HEAD_BYTES))
+            if identity is None:
+                f.seek(0)
+                digest = hashlib.blake2b(digest_size=16)
+                for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                identity = digest.hexdigest()
+            identity += f":{os.fstat(f.fileno()).st_size}"
+    elif os.path.exists(os.path.join(tf_dir, ".terraform")):
+        try:
+            proc = subprocess.Popen(["terraform", "state", "pull"], cwd=tf_dir,
+                                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        except OSError:
+            return None
+        try:
+            identity = state_identity(proc.stdout.read(STATE_HEAD_BYTES))
+        finally:
+            proc.kill()
+            proc.stdout.close()
+            proc.wait()
+        if identity is None:
+            return None
+    else:
+        return None
+    return hashlib.sha256(f"v{CACHE_VERSION}:{identity}".encode('utf-8')).hexdigest()
+
+def cache_path(key, cache_dir=None):
+    return os.path.join(cache_dir or CACHE_DIR, f"{key}.json")
+
+def load_cached_summary(key, cache_dir=None):
+    """The cached summary for `key`, marked as recently used, or None."""
+    path = cache_path(key, cache_dir)
+    try:
+        with open(path, 'r') as f:
+            summary = json.load(f)
+        os.utime(path)
+    except (OSError, ValueError):
+        return None
+    return summary
+
+def save_cached_summary(key, summary, cache_dir=None, max_bytes=CACHE_MAX_BYTES):
+    """Store a summary, then evict the least recently used entries beyond `max_bytes`."""
+    path = cache_path(key, cache_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(summary, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    # Concurrent runs may evict the same entries; one already gone is simply skipped
+    entries = []
+    for entry in os.scandir(os.path.dirname(path)):
+        if entry.name.endswith('.json'):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry_path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if entry_path != path:
+            try:
+                os.remove(entry_path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+def resource_array_kind(keys):
+    """
+    'raw' for the top-level `resources` of a v4 state file, 'module' for the `resources`
+    of the root or a child module in `terraform show -json` output, else None.
+    `keys` are the object keys leading to the array.
+    """
+    if keys == ['resources']:
+        return 'raw'
+    if (keys[:2] == ['values', 'root_module'] and keys[-1] == 'resources'
+            and all(key == 'child_modules' for key in keys[2:-1])):
+        return 'module'
+    return None
+
+def iter_state_resources(stream, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Yield ('raw' | 'module', resource) from a state or `terraform show -json` byte stream
+    while reading it, ijson-style. Only the JSON skeleton around the resource arrays is
+    scanned token by token; each resource object is decoded on its own by the C decoder.
+    Raises ValueError on malformed or truncated input.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    buffer, pos, eof = '', 0, False
+    stack = []  # [is_object, current key, expecting a key] per open container
+
+    while True:
+        match = _STREAM_TOKEN_RE.search(buffer, pos)
+        if match is None or (match.group(0)[0] == '"' and match.group(1) is None):
+            # Out of tokens, or a string runs past the end of the buffer
+            if eof:
+                break
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos if match is None else match.start():] + decoder.decode(chunk, final=eof)
+            pos = 0
+            continue
+
+        token = match.group(0)
+        if token == '{' and stack and not stack[-1][0]:
+            kind = resource_array_kind([frame[1] for frame in stack if frame[0]])
+            if kind:
+                try:
+                    resource, pos = _decoder.raw_decode(buffer, match.start())
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    # Incomplete resource: read until the buffer doubles, then decode it again
+                    buffer, pos = buffer[match.start():], 0
+                    target = 2 * len(buffer)
+                    while not eof and len(buffer) < target:
+                        chunk = stream.read(chunk_size)
+                        eof = not chunk
+                        buffer += decoder.decode(chunk, final=eof)
+                    continue
+                yield kind, resource
+                continue
+
+        pos = match.end()
+        if token in '{[':
+            stack.append([token == '{', None, token == '{'])
+        elif token in '}]':
+            if not stack:
+                raise ValueError(f"Unbalanced '{token}' in JSON input")
+            stack.pop()
+        elif token == ',':
+            if stack and stack[-1][0]:
+                stack[-1][2] = True
+        elif token == ':':
+            if stack:
+                stack[-1][2] = False
+        elif stack and stack[-1][0] and stack[-1][2]:
+            stack[-1][1] = json.loads(token)
+
+    if stack:
+        raise ValueError("Truncated JSON input")
+
 def simplify_resource(resource):
     """Extract key fields from a resource."""
     # Common useful attributes across most AWS/K8s resources
@@ -66,6 +324,9 @@ def simplify_resource(resource):
         spec = attributes.get('spec', [{}])[0]
         summary['cluster_ip'] = spec.get('cluster_ip')
         summary['ports'] = spec.get('port')
+
+    if resource.get('depends_on'):
+        summary['depends_on'] = resource['depends_on']
     
     return summary
 
@@ -83,51 +344,487 @@ def traverse_modules(module, resources_list):
         for child in module['child_modules']:
             traverse_modules(child, resources_list)
 
-def summarize_state(tf_dir):
+def simplify_raw_resource(res):
+    """
+    Basic mapping for a raw v4 state file resource, whose attributes (and dependencies)
+    are nested in instances.
+    """
+    parts = [res['module']] if res.get('module') else []
+    if res.get('mode') == 'data':
+        parts.append('data')
+    summary = {
+        "address": '.'.join(parts + [f"{res.get('type')}.{res.get('name')}"]),
+        "type": res.get('type'),
+        "name": res.get('name'),
+    }
+    if res.get('instances'):
+        summary['id'] = res['instances'][0].get('attributes', {}).get('id')
+    depends_on = {dep: None for instance in res.get('instances', []) for dep in instance.get('dependencies', [])}
+    if depends_on:
+        summary['depends_on'] = list(depends_on)
+    return summary
+
+def base_address(address):
+    """
+    Configuration address without instance keys, of the resource and of any counted
+    modules: `module.app["a"].aws_instance.web[0]` -> `module.app.aws_instance.web`.
+    """
+    return INSTANCE_KEY_RE.sub('', address) if '[' in address else address
+
+def dependency_edges(resources):
+    """
+    Adjacency list (index -> sorted dependency indices) of `depends_on` between resources.
+    A dependency names a resource (matching all its instances) or a module (matching
+    everything in it); dependencies outside `resources`, such as data sources, are dropped.
+    Dependencies are configuration addresses, so they match across module instances too.
+    """
+    by_address = {}
+    bases = [base_address(res['address']) for res in resources]
+    for i, res in enumerate(resources):
+        by_address.setdefault(res['address'], []).append(i)
+        if bases[i] != res['address']:
+            by_address.setdefault(bases[i], []).append(i)
+
+    resolved = {}
+    def resolve(dep):
+        if dep not in resolved:
+            if dep in by_address:
+                resolved[dep] = by_address[dep]
+            elif dep.startswith('module.'):
+                resolved[dep] = [i for i, res in enumerate(resources)
+                                 if res['address'].startswith(dep + '.') or bases[i].startswith(dep + '.')]
+            else:
+                resolved[dep] = []
+        return resolved[dep]
+
+    return [sorted({j for dep in res.get('depends_on', []) for j in resolve(dep) if j != i})
+            for i, res in enumerate(resources)]
+
+def transitive_reduction(edges):
+    """
+    Drop edges implied by longer paths (u -> w -> ... -> v makes u -> v redundant), using
+    reachability bitsets in reverse topological order. Graphs with cycles are returned as is.
+    """
+    indegree = [0] * len(edges)
+    for targets in edges:
+        for v in targets:
+            indegree[v] += 1
+    order = [u for u in range(len(edges)) if indegree[u] == 0]
+    for u in order:  # Kahn's algorithm, appending while iterating
+        for v in edges[u]:
+            indegree[v] -= 1
+            if indegree[v] == 0:
+                order.append(v)
+    if len(order) < len(edges):
+        print("Warning: dependency cycle found; skipping transitive reduction.", file=sys.stderr)
+        return edges
+
+    reach = [0] * len(edges)  # Bit v set: v reachable from u in one or more steps
+    reduced = [None] * len(edges)
+    for u in reversed(order):
+        implied = 0
+        for v in edges[u]:
+            implied |= reach[v]
+        reduced[u] = [v for v in edges[u] if not implied >> v & 1]
+        for v in edges[u]:
+            reach[u] |= reach[v] | 1 << v
+    return reduced
+
+def collapse_types(resources, edges):
+    """
+    Merge resources of the same type whose dependencies and dependents are identical
+    (e.g. the instances of one count/for_each) into single "N× type" nodes.
+    Returns (nodes, edges) of the collapsed graph.
+    """
+    dependents = [[] for _ in edges]
+    for u, targets in enumerate(edges):
+        for v in targets:
+            dependents[v].append(u)
+    groups = {}
+    for i, res in enumerate(resources):
+        groups.setdefault((res['type'], tuple(edges[i]), tuple(dependents[i])), []).append(i)
+
+    group_of, nodes, ids = {}, [], {}
+    for members in groups.values():
+        for i in members:
+            group_of[i] = len(nodes)
+        if len(members) == 1:
+            node = dict(resources[members[0]])
+            node.pop('depends_on', None)
+        else:
+            node_id = f"{len(members)}× {resources[members[0]]['type']}"
+            ids[node_id] = ids.get(node_id, 0) + 1
+            if ids[node_id] > 1:
+                node_id += f" #{ids[node_id]}"
+            node = {"address": node_id, "type": resources[members[0]]['type'], "count": len(members),
+                    "sample": resources[members[0]]['address']}
+        nodes.append(node)
+
+    collapsed = [set() for _ in nodes]
+    for u, targets in enumerate(edges):
+        collapsed[group_of[u]].update(group_of[v] for v in targets if group_of[v] != group_of[u])
+    return nodes, [sorted(targets) for targets in collapsed]
+
+def build_graph(resources, compact=False, reduce=False, collapse=False):
+    """
+    Dependency graph of summarized resources: `nodes` and `edges` from each node to what
+    it depends on. Edges are keyed by address, or with `compact` given as
+    [node index, dependency indices...] rows for nodes that have dependencies.
+    """
+    edges = dependency_edges(resources)
+    if reduce:
+        edges = transitive_reduction(edges)
+    if collapse:
+        nodes, edges = collapse_types(resources, edges)
+    else:
+        nodes = []
+        for res in resources:
+            node = dict(res)
+            node.pop('depends_on', None)
+            nodes.append(node)
+
+    if compact:
+        encoded = [[u] + targets for u, targets in enumerate(edges) if targets]
+    else:
+        encoded = {nodes[u]['address']: [nodes[v]['address'] for v in targets]
+                   for u, targets in enumerate(edges) if targets}
+    return {"node_count": len(nodes), "edge_count": sum(len(targets) for targets in edges),
+            "nodes": nodes, "edges": encoded}
+
+def apply_graph(output, graph_options):
+    """Replace the flat `resources` of a summary (or of each workspace section) with their graph."""
+    if graph_options is None:
+        return output
+    if 'workspaces' in output:
+        return dict(output, workspaces=[apply_graph(section, graph_options) for section in output['workspaces']])
+    if 'resources' not in output:
+        return output
+    output = dict(output)
+    output['graph'] = build_graph(output.pop('resources'), **graph_options)
+    return output
+
+def resource_hash(resource):
+    return hashlib.blake2b(json.dumps(resource, sort_keys=True, separators=(',', ':')).encode('utf-8'),
+                           digest_size=16).digest()
+
+def diff_resources(before, after):
+    """
+    Resources added, removed (by address) and changed (the differing fields, as
+    [before, after]) from `before` to `after`, matched by address. One hash per
+    resource decides whether it changed, so the diff is linear in both lists.
+    """
+    previous = {res['address']: res for res in before}
+    hashes = {address: resource_hash(res) for address, res in previous.items()}
+    added, changed, seen = [], [], set()
+    for res in after:
+        address = res['address']
+        seen.add(address)
+        if address not in previous:
+            added.append(res)
+        elif resource_hash(res) != hashes[address]:
+            old = previous[address]
+            changed.append({"address": address,
+                            "changes": {key: [old.get(key), res.get(key)] for key in sorted(old.keys() | res.keys())
+                                        if old.get(key) != res.get(key)}})
+    removed = [address for address in previous if address not in seen]
+    return {"added": added, "removed": removed, "changed": changed}
+
+def section_key(section):
+    """
+    What identifies a workspace section across runs: its `key`. Labels are relative to
+    the workspaces found in one run, so they only stand in for sections saved without one.
+    """
+    return section.get('key') or section['workspace']
+
+def summary_sections(summary):
+    """{workspace key: resources} of a summary; a single-workspace summary has the key None."""
+    if 'workspaces' in summary:
+        return {section_key(section): section.get('resources', []) for section in summary['workspaces']}
+    if 'resources' in summary:
+        return {None: summary['resources']}
+    raise ValueError("not a resource summary (graph output cannot be diffed; save summaries with --save)")
+
+def carry_failed_sections(previous, current):
+    """
+    `current` with each workspace that failed in it keeping its resources from `previous`,
+    so saving it as the next --since baseline does not record them as removed.
+    """
+    if not ('workspaces' in previous and 'workspaces' in current):
+        return current
+    before = {section_key(section): section for section in previous['workspaces']}
+    workspaces = []
+    for section in current['workspaces']:
+        if 'error' in section and section_key(section) in before:
+            kept = before[section_key(section)]
+            section = dict(section, resources=kept.get('resources', []),
+                           resource_count=len(kept.get('resources', [])))
+        workspaces.append(section)
+    return dict(current, workspaces=workspaces,
+                resource_count=sum(len(section.get('resources', [])) for section in workspaces))
+
+def load_summary(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_summary(path, summary):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(summary, f, indent=2)
+    os.replace(tmp_path, path)
+
+def diff_summaries(previous, current, since=None):
+    """
+    The delta between two summaries, per workspace when they have several; unchanged ones
+    are omitted. A workspace that failed in `current` is reported with its error, not diffed.
+    """
+    before, after = summary_sections(previous), summary_sections(current)
+    if None in before and None not in after and len(after) == 1:
+        before = {next(iter(after)): before[None]}  # Saved before single workspaces were sectioned
+    if (None in before) != (None in after):
+        raise ValueError("cannot diff a single-workspace summary against a multi-workspace one")
+
+    output = {"summary": "Terraform Infrastructure Diff", "since": since,
+              "resource_count": sum(len(resources) for resources in after.values())}
+    if None in after:
+        delta = diff_resources(before[None], after[None])
+        output.update({f"{kind}_count": len(items) for kind, items in delta.items()})
+        output.update(delta)
+        return output
+
+    # Sections are matched by key and shown with their latest label
+    labels = {section_key(section): section['workspace']
+              for section in previous.get('workspaces', []) + current['workspaces']}
+    errors = {section_key(section): section['error'] for section in current['workspaces'] if 'error' in section}
+    workspaces = []
+    for key in list(after) + [key for key in before if key not in after]:
+        if key in errors:
+            workspaces.append({"workspace": labels[key], "error": errors[key]})
+            continue
+        delta = diff_resources(before.get(key, []), after.get(key, []))
+        if any(delta.values()):
+            workspaces.append(dict({"workspace": labels[key]}, **delta))
+    for kind in ("added", "removed", "changed"):
+        output[f"{kind}_count"] = sum(len(section.get(kind, [])) for section in workspaces)
+    output["workspaces"] = workspaces
+    return output
+
+def stream_resources(stream, resources_list, chunk_size=STREAM_CHUNK_SIZE):
+    """Streaming counterpart of parsing the state and calling `traverse_modules`."""
+    for kind, res in iter_state_resources(stream, chunk_size):
+        if kind == 'raw':
+            resources_list.append(simplify_raw_resource(res))
+        elif res.get('mode') == 'managed':
+            resources_list.append(simplify_resource(res))
+
+def load_resources(tf_dir, stream=False):
+    """Simplified resources of the state in `tf_dir`, or None if there is no readable state."""
+    resources = []
+    if stream:
+        try:
+            with open_terraform_output(tf_dir) as output:
+                if output is None:
+                    return None
+                stream_resources(output, resources)
+        except subprocess.CalledProcessError as e:
+            print(f"Error running terraform show: {e.stderr}")
+            return None
+        except ValueError:
+            print("Error analyzing terraform output.")
+            return None
+        return resources
+
     data = get_terraform_output(tf_dir)
-    
     if not data:
-        print(json.dumps({"error": "No state found or terraform error", "resources": []}, indent=2))
-        return
+        return None
 
     # Terraform JSON output structure
     # root_module (values) -> child_modules ...
     
-    resources = []
-    
     # Should handle both direct state file structure and `terraform show -json` output
     # `terraform show -json` usually wraps in "values" -> "root_module"
     
     root = data.get('values', {}).get('root_module', {})
     if not root and 'resources' in data: 
         # Raw v4 state file format
-        raw_resources = data.get('resources', [])
-        for res in raw_resources:
-             # Basic mapping for raw state file which has flattened resources
-             summary = {
-                 "address": f"{res.get('type')}.{res.get('name')}",
-                 "type": res.get('type'),
-                 "name": res.get('name'),
-             }
-             # Attributes are nested in instances
-             if res.get('instances'):
-                 summary['id'] = res['instances'][0].get('attributes', {}).get('id')
-             resources.append(summary)
+        for res in data.get('resources', []):
+            resources.append(simplify_raw_resource(res))
     else:
         traverse_modules(root, resources)
+    return resources
+
+def summarize_workspace(tf_dir, stream=False, use_cache=True):
+    """The summary of one Terraform directory, or None if it has no readable state."""
+    key = state_cache_key(tf_dir) if use_cache else None
+    output = load_cached_summary(key) if key else None
+    if output is None:
+        resources = load_resources(tf_dir, stream)
+        if resources is None:
+            return None
+
+        output = {
+            "summary": "Terraform Infrastructure Graph",
+            "resource_count": len(resources),
+            "resources": resources
+        }
+        # Not cached if the state changed while it was being read
+        if key and state_cache_key(tf_dir) == key:
+            try:
+                save_cached_summary(key, output)
+            except OSError as e:  # Read-only checkout, full disk: the summary is still good
+                print(f"Warning: could not cache the summary: {e}", file=sys.stderr)
+    return output
+
+def summarize_state(tf_dir, stream=False, use_cache=True, graph_options=None):
+    output = summarize_workspace(tf_dir, stream, use_cache)
+    
+    if output is None:
+        print(json.dumps({"error": "No state found or terraform error", "resources": []}, indent=2))
+        return
+    
+    print(json.dumps(apply_graph(output, graph_options), indent=2))
+
+def is_workspace(path):
+    """A Terraform root to summarize: initialized, or holding a local state file."""
+    return (os.path.isdir(os.path.join(path, ".terraform"))
+            or os.path.exists(os.path.join(path, "terraform.tfstate")))
+
+def expand_workspaces(paths):
+    """
+    Directories that are workspaces as given; others are walked for workspaces
+    (not descending into `.terraform` or into a workspace). Sorted, de-duplicated.
+    """
+    found = {}
+    for path in paths:
+        if is_workspace(path) or not os.path.isdir(path):
+            found[path] = None  # Missing or empty directories are reported per workspace
+            continue
+        for root, dirs, _ in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+            if is_workspace(root):
+                found[root] = None
+                dirs[:] = []
+    return list(found)
 
-    output = {
+def workspace_label(tf_dir, common):
+    label = os.path.relpath(os.path.abspath(tf_dir), common) if common else tf_dir
+    workspace = selected_workspace(tf_dir)
+    return f"{label}:{workspace}" if workspace != 'default' else label
+
+def workspace_key(tf_dir):
+    """
+    Identity of a workspace that does not depend on which other workspaces a run found:
+    its path from the working directory, with the selected workspace unless default.
+    """
+    key = os.path.relpath(os.path.abspath(tf_dir))
+    workspace = selected_workspace(tf_dir)
+    return f"{key}:{workspace}" if workspace != 'default' else key
+
+def _summarize_workspace_job(tf_dir, stream, use_cache):
+    """Pool worker: (summary or None, error message or None, wall time in seconds)."""
+    start = time.perf_counter()
+    output, error = None, None
+    try:
+        output = summarize_workspace(tf_dir, stream, use_cache)
+        if output is None:
+            error = "No state found or terraform error"
+    except (OSError, ValueError) as e:  # One unreadable workspace must not sink the others
+        error = str(e)
+    return output, error, time.perf_counter() - start
+
+def summarize_workspaces(tf_dirs, stream=False, use_cache=True, jobs=DEFAULT_JOBS):
+    """
+    Summarize several Terraform directories concurrently, at most `jobs` at a time,
+    into one graph with a section per workspace (in path order), each with the wall
+    time its summary took.
+    """
+    common = None
+    if len(tf_dirs) > 1:
+        common = os.path.commonpath([os.path.abspath(path) for path in tf_dirs])
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, min(jobs, len(tf_dirs)))) as pool:
+        futures = [pool.submit(_summarize_workspace_job, tf_dir, stream, use_cache) for tf_dir in tf_dirs]
+        results = [future.result() for future in futures]
+
+    workspaces = []
+    for tf_dir, (output, error, seconds) in zip(tf_dirs, results):
+        section = {"workspace": workspace_label(tf_dir, common), "key": workspace_key(tf_dir), "path": tf_dir,
+                   "wall_time_s": round(seconds, 3)}
+        if output is None:
+            section.update({"error": error, "resource_count": 0, "resources": []})
+        else:
+            section.update({"resource_count": output["resource_count"], "resources": output["resources"]})
+        workspaces.append(section)
+
+    return {
         "summary": "Terraform Infrastructure Graph",
-        "resource_count": len(resources),
-        "resources": resources
+        "workspace_count": len(workspaces),
+        "resource_count": sum(section["resource_count"] for section in workspaces),
+        "wall_time_s": round(time.perf_counter() - start, 3),
+        "workspaces": workspaces
     }
-    
-    print(json.dumps(output, indent=2))
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: ./summarize_infra.py <path_to_terraform_dir>")
+    parser = argparse.ArgumentParser(description="Summarize Terraform state for LLM context")
+    parser.add_argument("tf_dirs", nargs="+", metavar="tf_dir",
+                        help="Terraform directories, or roots to scan for workspaces")
+    parser.add_argument("--stream", action="store_true",
+                        help="Decode resources incrementally (bounded memory for huge states)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help=f"Ignore and do not update the summary cache in {CACHE_DIR}")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS,
+                        help="Workspaces summarized concurrently")
+    parser.add_argument("--graph", action="store_true",
+                        help="Emit a depends_on adjacency list instead of the flat resource list")
+    parser.add_argument("--compact-edges", action="store_true",
+                        help="Graph: encode edges as node index rows [node, dependencies...]")
+    parser.add_argument("--reduce", action="store_true",
+                        help="Graph: drop edges implied by longer dependency paths")
+    parser.add_argument("--collapse-types", action="store_true",
+                        help="Graph: merge same-type resources with identical edges into 'N× type' nodes")
+    parser.add_argument("--since", metavar="PREVIOUS_SUMMARY",
+                        help="Only emit resources added, removed or changed since this summary (see --save)")
+    parser.add_argument("--save", metavar="PATH", help="Also write the full summary to PATH")
+    args = parser.parse_args()
+    graph_options = None
+    if args.graph or args.compact_edges or args.reduce or args.collapse_types:
+        if args.since:
+            parser.error("--since cannot be combined with graph output")
+        graph_options = {'compact': args.compact_edges, 'reduce': args.reduce, 'collapse': args.collapse_types}
+
+    tf_dirs = expand_workspaces(args.tf_dirs)
+    if not tf_dirs:
+        print(json.dumps({"error": "No Terraform workspaces found", "resources": []}, indent=2))
         sys.exit(1)
-        
-    tf_dir = sys.argv[1]
-    summarize_state(tf_dir)
+    if len(tf_dirs) == 1 and not (args.since or args.save):
+        summarize_state(tf_dirs[0], args.stream, not args.no_cache, graph_options)
+        sys.exit(0)
+
+    # Sectioned even for one workspace, so a baseline can be diffed once more appear
+    output = summarize_workspaces(tf_dirs, args.stream, not args.no_cache, args.jobs)
+    if len(tf_dirs) == 1 and 'error' in output['workspaces'][0]:
+        print(json.dumps({"error": output['workspaces'][0]['error'], "resources": []}, indent=2))
+        sys.exit(1)
+
+    # Diff before saving, so --since and --save can name the same file
+    full_output, previous = output, None
+    if args.since:
+        try:
+            previous = load_summary(args.since)
+            output = diff_summaries(previous, output, args.since)
+        except (OSError, ValueError) as e:
+            print(json.dumps({"error": f"Cannot diff against {args.since}: {e}"}, indent=2))
+            sys.exit(1)
+    if args.save:
+        if previous is None and os.path.exists(args.save):
+            try:
+                previous = load_summary(args.save)
+            except (OSError, ValueError):
+                pass
+        if isinstance(previous, dict):
+            full_output = carry_failed_sections(previous, full_output)
+        save_summary(args.save, full_output)
+    print(json.dumps(apply_graph(output, graph_options), indent=2))